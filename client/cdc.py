@@ -0,0 +1,143 @@
+"""
+This module implements FastCDC content-defined chunking. Files are split into variable-size
+chunks whose boundaries depend on the file content (a Gear rolling hash), so a local edit only
+changes the chunks around it. The client and the server use the same parameters, so both sides
+cut identical files into identical chunks and can compare them by hash.
+"""
+
+import mmap
+import hashlib
+
+# Numba is optional: the rolling-hash loop only runs compiled to machine code, and without
+# Numba no file is chunked (delta transfers are disabled, see COMPILED_CHUNKING)
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    np = None
+    njit = None
+
+# Whether chunking is available. Interpreted, the loop takes about 0.4 s per MB, which is slower than
+# sending the whole file, so delta transfers are only used when it is compiled
+COMPILED_CHUNKING = njit is not None
+
+# Minimum, average and maximum chunk sizes in bytes
+MIN_SIZE = 4 * 1024
+AVG_SIZE = 16 * 1024
+MAX_SIZE = 64 * 1024
+
+# Normalized chunking masks: a stricter mask (more bits) is used before the average size is
+# reached and a looser one after it, which narrows the spread of chunk sizes around AVG_SIZE
+MASK_S = ((1 << 16) - 1) << 48
+MASK_L = ((1 << 12) - 1) << 52
+
+# 256-entry table of pseudo-random 64-bit values driving the Gear hash, derived deterministically
+# so that every client and server computes the same boundaries
+GEAR_TABLE = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'little') for i in range(256))
+
+
+if njit is not None:
+    _GEAR_ARRAY = np.array(GEAR_TABLE, dtype=np.uint64)
+
+    @njit(cache=True, boundscheck=False)
+    def _fastcdc_split(buf, mask_s, mask_l, min_size, avg_size, max_size, table):
+        """
+        Finds the end of every chunk of a buffer. Before the average chunk size, only boundaries
+        matching the stricter mask are accepted, and after it those matching the looser mask.
+
+        Args:
+            buf (numpy.ndarray): The buffer to split, as an array of uint8.
+            mask_s (numpy.uint64): The mask used before the average chunk size is reached.
+            mask_l (numpy.uint64): The mask used after the average chunk size is reached.
+            min_size (int): The minimum chunk size.
+            avg_size (int): The average chunk size.
+            max_size (int): The maximum chunk size.
+            table (numpy.ndarray): The Gear table, as an array of uint64.
+
+        Returns:
+            numpy.ndarray: The end offsets (exclusive) of every chunk, as an array of int64.
+        """
+        end = buf.shape[0]
+        boundaries = np.empty(end // min_size + 1, dtype=np.int64)
+        count = 0
+        start = 0
+        one = np.uint64(1)
+        zero = np.uint64(0)
+
+        while start < end:
+            size = end - start
+            cut = end
+
+            if size > min_size:
+                size = min(size, max_size)
+                normal_size = min(size, avg_size)
+                cut = start + size
+                fingerprint = zero
+                i = start + min_size
+
+                while i < start + normal_size:
+                    fingerprint = (fingerprint << one) + table[buf[i]]
+                    if fingerprint & mask_s == zero:
+                        cut = i + 1
+                        break
+                    i += 1
+                else:
+                    while i < start + size:
+                        fingerprint = (fingerprint << one) + table[buf[i]]
+                        if fingerprint & mask_l == zero:
+                            cut = i + 1
+                            break
+                        i += 1
+
+            boundaries[count] = cut
+            count += 1
+            start = cut
+
+        return boundaries[:count]
+
+
+def chunk_boundaries(data):
+    """
+    Splits a buffer into content-defined chunks.
+
+    Args:
+        data (bytes-like): The buffer to split.
+
+    Returns:
+        list: The end offsets (exclusive) of every chunk, in order.
+
+    Raises:
+        RuntimeError: If Numba is not installed.
+    """
+    if not COMPILED_CHUNKING:
+        raise RuntimeError('Content-defined chunking requires the numba and numpy packages')
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    return _fastcdc_split(buf, np.uint64(MASK_S), np.uint64(MASK_L),
+                          MIN_SIZE, AVG_SIZE, MAX_SIZE, _GEAR_ARRAY).tolist()
+
+
+def chunk_file(file_path):
+    """
+    Splits a file into content-defined chunks and hashes each chunk with SHA-256.
+
+    Args:
+        file_path (str): The path of the file to split.
+
+    Returns:
+        list: A list of dictionaries with the 'hash', 'offset' and 'length' of every chunk.
+    """
+    chunks = []
+    with open(file_path, 'rb') as f:
+        # Zero-byte files cannot be memory-mapped and have no chunks
+        if f.seek(0, 2) == 0:
+            return chunks
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+            offset = 0
+            for boundary in chunk_boundaries(mm):
+                chunk_hash = hashlib.sha256(mv[offset:boundary]).hexdigest()
+                chunks.append({'hash': chunk_hash, 'offset': offset, 'length': boundary - offset})
+                offset = boundary
+
+    return chunks
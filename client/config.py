@@ -9,6 +9,15 @@ SERVER_URL = 'http://:8080'
 # Defines the local folder path on the client machine to be synchronized
 LOCAL_FOLDER = ''
 
+# Algorithm used to fingerprint files: 'blake3' (requires the 'blake3' package) or 'sha256'.
+# It must be the same on the client and the server; 'sha256' keeps compatibility with
+# clients and servers that have not been migrated yet
+HASH_ALGORITHM = 'blake3'
+
+# Maximum number of seconds between two synchronizations with the server; local changes
+# trigger a synchronization as soon as they have been pushed to the server
+SYNC_INTERVAL = 60
+
 # List of file and folder patterns to ignore during synchronization
 # These patterns typically correspond to temporary, system, or unnecessary files
 ignore_patterns = [
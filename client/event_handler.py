@@ -6,29 +6,141 @@ to synchronize these events based on defined rules and ignore patterns.
 
 import os
 import time
+import queue
 import logging
-from watchdog.events import FileSystemEventHandler
-from file_utils import upload_file, delete_file, is_ignored_file
+import functools
+import threading
+from collections import OrderedDict
+from watchdog.events import PatternMatchingEventHandler
+from file_utils import upload_files, delete_file, is_ignored_file
 
 
-class ChangeHandler(FileSystemEventHandler):
+class ChangeHandler(PatternMatchingEventHandler):
     """
     Handles file system events such as creation, deletion, modification, and moving of files.
     It processes events and interacts with the server to keep the file system in sync.
+    Directory events and events for ignored files are filtered out by Watchdog before
+    they reach the handler methods.
     """
-    def __init__(self, server_url, ignore_patterns):
+    def __init__(self, server_url, ignore_patterns, sync_event=None):
         """
         Initializes the ChangeHandler with server URL and ignore patterns.
 
         Args:
             server_url (str): The URL of the server for synchronization.
-            ignore_patterns (list): List of patterns for temporary files to ignore.
+            ignore_patterns (IgnoreMatcher or list): Patterns for temporary files to ignore.
+            sync_event (threading.Event): Optional event set once a local change has been
+                pushed to the server, to trigger a synchronization.
         """
-        super().__init__()
+        # A file is ignored if its name starts or ends with one of the patterns
+        super().__init__(
+            ignore_patterns=[pattern + '*' for pattern in ignore_patterns] + ['*' + pattern for pattern in ignore_patterns],
+            ignore_directories=True,
+            case_sensitive=True,
+        )
         self.server_url = server_url
-        self.ignore_patterns = ignore_patterns
-        self.last_modified_time = {}  # Track the last modified timestamp of files
+        self.sync_event = sync_event
+        # Ignore check bound to the raw patterns once ('ignore_patterns' holds Watchdog's globs)
+        self._is_ignored = functools.partial(is_ignored_file, ignore_patterns=ignore_patterns)
+        self.last_modified_time = OrderedDict()  # Track the last modified timestamp of files (LRU order)
         self.debounce_time = 1  # 1 second debounce time
+        self.max_tracked_files = 4096  # Maximum number of files tracked for debouncing
+        self.batch_interval = 0.2  # Collect upload events for 200 ms before sending them
+        self.max_batch_size = 100  # Maximum number of files sent in one upload request
+
+        # Changes waiting to be pushed to the server, as ('upload' or 'delete', file path) pairs,
+        # drained in order by a background thread, so a deletion never overtakes an upload in flight
+        self._change_queue = queue.Queue()
+
+        # Number of queued or in-flight changes of each file path; the server does not reflect these
+        # files yet, so synchronizations must leave them alone
+        self._pending_changes = {}
+        self._pending_lock = threading.Lock()
+        threading.Thread(target=self._change_worker, daemon=True).start()
+
+    def _change_worker(self):
+        """
+        Drains the change queue in the background, coalescing bursts of upload events
+        into a single batched upload request, and sending deletions in order with them.
+        """
+        while True:
+            # Block until at least one change is waiting, then give the burst time to accumulate
+            changes = [self._change_queue.get()]
+            time.sleep(self.batch_interval)
+
+            while len(changes) < self.max_batch_size:
+                try:
+                    changes.append(self._change_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                # Uploads are batched until a deletion, which is sent once the uploads queued
+                # before it have been sent (the deleted file itself no longer needs uploading)
+                file_paths = []
+                for action, file_path in changes:
+                    if action == 'upload':
+                        file_paths.append(file_path)
+                        continue
+
+                    file_paths = [path for path in file_paths if path != file_path]
+                    self._upload(file_paths)
+                    file_paths = []
+                    delete_file(self.server_url, os.path.basename(file_path))
+                self._upload(file_paths)
+            finally:
+                with self._pending_lock:
+                    for _, file_path in changes:
+                        self._pending_changes[file_path] -= 1
+                        if not self._pending_changes[file_path]:
+                            del self._pending_changes[file_path]
+            self._request_sync()
+
+    def _upload(self, file_paths):
+        """
+        Uploads a batch of files in one request.
+
+        Args:
+            file_paths (list): The paths of the files to upload.
+        """
+        if file_paths:
+            # Drop duplicate paths (e.g. create followed by modify) while preserving order
+            upload_files(self.server_url, list(dict.fromkeys(file_paths)))
+
+    def _queue_change(self, action, file_path):
+        """
+        Queues a change to push to the server.
+
+        Args:
+            action (str): 'upload' or 'delete'.
+            file_path (str): The path of the file that changed.
+        """
+        with self._pending_lock:
+            self._pending_changes[file_path] = self._pending_changes.get(file_path, 0) + 1
+        self._change_queue.put((action, file_path))
+
+    def pending_files(self):
+        """
+        Returns the names of the files with changes queued or being pushed to the server.
+
+        Returns:
+            set: The file names (relative to the monitored folder).
+        """
+        with self._pending_lock:
+            return {os.path.basename(file_path) for file_path in self._pending_changes}
+
+    def _request_sync(self):
+        """
+        Signals that the server has changed, so the main loop synchronizes without waiting
+        for its next periodic run. This is only done once every change has reached the server
+        (nothing queued or in flight), otherwise the sync would see a new local file as
+        missing from the server and remove it, or download a deleted file back.
+        """
+        with self._pending_lock:
+            if self._pending_changes:
+                return
+        if self.sync_event is not None:
+            self.sync_event.set()
 
     def on_created(self, event):
         """
@@ -37,9 +149,8 @@ class ChangeHandler(FileSystemEventHandler):
         Args:
             event (FileSystemEvent): The event containing details about the created file.
         """
-        if not event.is_directory and not is_ignored_file(os.path.basename(event.src_path), self.ignore_patterns):
-            logging.info(f"File created: {event.src_path}")
-            upload_file(self.server_url, event.src_path)
+        logging.info("File created: %s", event.src_path)
+        self._queue_change('upload', event.src_path)
 
     def on_deleted(self, event):
         """
@@ -48,9 +159,8 @@ class ChangeHandler(FileSystemEventHandler):
         Args:
             event (FileSystemEvent): The event containing details about the deleted file.
         """
-        if not event.is_directory and not is_ignored_file(os.path.basename(event.src_path), self.ignore_patterns):
-            logging.info(f"File deleted: {event.src_path}")
-            delete_file(self.server_url, os.path.basename(event.src_path))
+        logging.info("File deleted: %s", event.src_path)
+        self._queue_change('delete', event.src_path)
 
     def on_modified(self, event):
         """
@@ -59,15 +169,24 @@ class ChangeHandler(FileSystemEventHandler):
         Args:
             event (FileSystemEvent): The event containing details about the modified file.
         """
-        if not event.is_directory and not is_ignored_file(os.path.basename(event.src_path), self.ignore_patterns):
-            current_time = time.time()
-            last_time = self.last_modified_time.get(event.src_path, 0)
+        # Local aliases, as this is the most frequent callback during bursts of writes
+        src_path = event.src_path
+        last_modified_time = self.last_modified_time
 
-            # Check if enough time has passed since the last modification to avoid redundant uploads
-            if current_time - last_time > self.debounce_time:
-                logging.info(f"File modified: {event.src_path}")
-                upload_file(self.server_url, event.src_path)
-                self.last_modified_time[event.src_path] = current_time  # Update the last modified time
+        # Use a monotonic clock, which is not affected by wall-clock adjustments
+        current_time = time.monotonic()
+        last_time = last_modified_time.get(src_path)
+
+        # Check if enough time has passed since the last modification to avoid redundant uploads
+        if last_time is None or current_time - last_time > self.debounce_time:
+            logging.info("File modified: %s", src_path)
+            self._queue_change('upload', src_path)
+            last_modified_time[src_path] = current_time  # Update the last modified time
+            last_modified_time.move_to_end(src_path)
+
+            # Forget the least recently modified file once the limit is exceeded
+            if len(last_modified_time) > self.max_tracked_files:
+                last_modified_time.popitem(last=False)
 
     def on_moved(self, event):
         """
@@ -76,7 +195,11 @@ class ChangeHandler(FileSystemEventHandler):
         Args:
             event (FileSystemEvent): The event containing details about the moved file.
         """
-        if not event.is_directory and not is_ignored_file(os.path.basename(event.src_path), self.ignore_patterns):
-            logging.info(f"File moved from {event.src_path} to {event.dest_path}")
-            delete_file(self.server_url, os.path.basename(event.src_path))
-            upload_file(self.server_url, event.dest_path)
+        logging.info("File moved from %s to %s", event.src_path, event.dest_path)
+
+        # Watchdog delivers a move if either of its paths is not ignored, so check both sides:
+        # e.g. an editor saving through a temporary file only has a destination to upload
+        if not self._is_ignored(os.path.basename(event.dest_path)):
+            self._queue_change('upload', event.dest_path)
+        if not self._is_ignored(os.path.basename(event.src_path)):
+            self._queue_change('delete', event.src_path)
@@ -6,9 +6,106 @@ The module communicates with the server using HTTP requests and handles errors w
 """
 
 import os
+import json
+import mmap
+import time
+import shutil
 import hashlib
 import requests
 import logging
+import functools
+import threading
+from contextlib import ExitStack
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+from cdc import chunk_file, COMPILED_CHUNKING
+from config import HASH_ALGORITHM
+
+# Shared HTTP session used for all requests to the server, so TCP (and TLS) connections
+# are pooled and kept alive across calls instead of being re-established per request
+SESSION = requests.Session()
+SESSION.headers.update({'Connection': 'keep-alive'})
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=3))
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=3))
+
+# Number of seconds a cached copy of the server's file list stays valid
+MANIFEST_TTL = 2
+
+# Files at least this large that already exist on the server are uploaded as a delta of
+# content-defined chunks instead of in full
+DELTA_MIN_SIZE = 1024 * 1024
+
+# Files at least this large are hashed from a memory map instead of being read in chunks
+MMAP_HASH_THRESHOLD = 1024 * 1024
+
+# Constructor for the hash objects used to fingerprint files. BLAKE3 is much faster than SHA-256;
+# the hashes only detect differences between copies, so no security property is lost
+if HASH_ALGORITHM == 'blake3':
+    from blake3 import blake3 as new_hash
+
+    # Constructor for the hash objects used for files of at least MMAP_HASH_THRESHOLD bytes:
+    # BLAKE3 hashes the subtrees of large inputs on a thread pool using all cores
+    new_large_hash = functools.partial(new_hash, max_threads=new_hash.AUTO)
+else:
+    new_hash = functools.partial(hashlib.new, HASH_ALGORITHM)
+    new_large_hash = new_hash
+
+# Cached server file lists, keyed by server URL: {server_url: (fetch_time, {filename: hash})}
+_manifest_cache = {}
+_manifest_lock = threading.Lock()
+
+
+class IgnoreMatcher:
+    """
+    A set of ignore patterns compiled once at startup and shared by every caller of 'is_ignored_file'.
+    It can be used wherever a list of patterns is expected, since iterating it yields the patterns.
+    """
+    __slots__ = ('patterns', '_by_length')
+
+    # Up to this many patterns, a tuple passed to startswith/endswith is the fastest check;
+    # beyond it, patterns are looked up by length so the cost no longer grows with their number
+    MAX_TUPLE_PATTERNS = 64
+
+    def __init__(self, patterns):
+        """
+        Initializes the matcher with a list of patterns.
+
+        Args:
+            patterns (list): List of patterns for files to ignore.
+        """
+        self.patterns = tuple(patterns)
+
+        # Group the patterns by length, so a filename's prefix and suffix of each length can be
+        # checked with one set lookup each
+        by_length = {}
+        for pattern in self.patterns:
+            by_length.setdefault(len(pattern), set()).add(pattern)
+        self._by_length = tuple((length, frozenset(group)) for length, group in sorted(by_length.items()))
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def matches(self, filename):
+        """
+        Checks if a filename starts or ends with any of the patterns.
+
+        Args:
+            filename (str): The name of the file to check.
+
+        Returns:
+            bool: True if the file matches a pattern, False otherwise.
+        """
+        if len(self.patterns) <= self.MAX_TUPLE_PATTERNS:
+            return filename.startswith(self.patterns) or filename.endswith(self.patterns)
+
+        for length, group in self._by_length:
+            # Patterns are sorted by length, so none of the remaining ones can match
+            if length > len(filename):
+                break
+            if filename[:length] in group or filename[len(filename) - length:] in group:
+                return True
+        return False
 
 
 def is_ignored_file(filename, ignore_patterns):
@@ -17,39 +114,171 @@ def is_ignored_file(filename, ignore_patterns):
 
     Args:
         filename (str): The name of the file to check.
-        ignore_patterns (list): List of patterns for files to ignore.
+        ignore_patterns (IgnoreMatcher or list): Compiled matcher or list of patterns for files to ignore.
 
     Returns:
         bool: True if the file is temporary, False otherwise.
     """
-    return any(filename.startswith(pattern) or filename.endswith(pattern) for pattern in ignore_patterns)
+    if isinstance(ignore_patterns, IgnoreMatcher):
+        return ignore_patterns.matches(filename)
+
+    # startswith/endswith accept a tuple and check every pattern in a single C-level call
+    patterns = tuple(ignore_patterns)
+    return filename.startswith(patterns) or filename.endswith(patterns)
+
+
+def _open_for_hashing(file_path):
+    """
+    Opens a file to be read once from start to end.
+
+    The file is opened without updating its access time where supported (saving an inode write per
+    hashed file), and the kernel is told it will be read sequentially, so it reads ahead more aggressively.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        file object: The file, opened in binary read mode.
+    """
+    flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+    try:
+        # O_NOATIME is only allowed on files owned by the current user
+        fd = os.open(file_path, flags | getattr(os, 'O_NOATIME', 0))
+    except PermissionError:
+        fd = os.open(file_path, flags)
+
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+    return os.fdopen(fd, 'rb')
 
 
 def compute_file_hash(file_path):
     """
-    Compute SHA-256 hash of a file.
+    Compute the hash of a file, using the algorithm selected by HASH_ALGORITHM (BLAKE3 or SHA-256).
 
     Args:
         file_path (str): The path to the file to compute the hash for.
 
     Returns:
-        str: The SHA-256 hash of the file as a hexadecimal string.
+        str: The hash of the file as a hexadecimal string, or None if the file could not be read.
     """
-    
-    # Create a new SHA-256 hash object
-    hash_sha256 = hashlib.sha256()
+
+    # Create a new hash object
+    file_hash = new_hash()
 
     try:
         # Open the specified file in binary read mode
-        with open(file_path, 'rb') as f:
-            # Read the file in chunks of 4096 bytes until the end of the file is reached
-            for chunk in iter(lambda: f.read(4096), b""):
-                # Update the hash object with the current chunk of data
-                hash_sha256.update(chunk)
+        with _open_for_hashing(file_path) as f:
+            size = os.fstat(f.fileno()).st_size
+
+            if size < mmap.PAGESIZE:
+                # Files smaller than a page are read with a single read call, which avoids the
+                # setup cost of a memory map or of the read loop's 256 KB buffer
+                file_hash.update(f.read())
+
+            elif size >= MMAP_HASH_THRESHOLD:
+                # Map the file and hash it as one contiguous buffer in a single update call,
+                # during which the hash implementation releases the GIL for the whole digest
+                # (and, with BLAKE3, spreads it over all cores)
+                file_hash = new_large_hash()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Page the mapping in with large sequential read-ahead instead of one fault per page
+                    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(mm) as mv:
+                        file_hash.update(mv)
+
+            elif hasattr(hashlib, 'file_digest'):
+                # Python 3.11+: let hashlib drive the read loop in C
+                file_hash = hashlib.file_digest(f, new_hash)
+
+            else:
+                # Older Python versions: read the file in one go
+                file_hash.update(f.read())
     except Exception as e:
-        logging.error(f'Error reading file {file_path}: {e}')
+        logging.error('Error reading file %s: %s', file_path, e)
+        return None
+
+    return file_hash.hexdigest()
+
+
+def get_server_manifest(server_url, max_age=MANIFEST_TTL):
+    """
+    Returns the server's file list as a dictionary of filenames and their hashes.
+    A cached copy is reused if it was fetched less than 'max_age' seconds ago.
+
+    Args:
+        server_url (str): The URL of the server.
+        max_age (float): Maximum age in seconds of a cached file list (0 forces a refetch).
+
+    Returns:
+        dict: A dictionary mapping filenames on the server to their hashes.
+
+    Raises:
+        requests.RequestException: If the file list could not be fetched from the server.
+    """
+    with _manifest_lock:
+        cached = _manifest_cache.get(server_url)
+
+    if cached is not None and time.monotonic() - cached[0] < max_age:
+        return cached[1]
+
+    # Send a GET request to the server to fetch the list of files on the server
+    response = SESSION.get(f"{server_url}/files")
+    response.raise_for_status()
 
-    return hash_sha256.hexdigest()
+    # Parse the server response to get a dictionary of filenames and their hashes
+    server_files = {file['filename']: file['hash'] for file in response.json()['files']}
+
+    with _manifest_lock:
+        _manifest_cache[server_url] = (time.monotonic(), server_files)
+
+    return server_files
+
+
+def get_cached_server_manifest(server_url):
+    """
+    Returns the last known server file list without contacting the server, however old it is.
+    It is refreshed by every synchronization and patched by this client's own uploads and deletions.
+
+    Args:
+        server_url (str): The URL of the server.
+
+    Returns:
+        dict: A dictionary mapping filenames on the server to their hashes, or 'None' if the
+              file list has not been fetched yet.
+    """
+    with _manifest_lock:
+        cached = _manifest_cache.get(server_url)
+    return cached[1] if cached is not None else None
+
+
+def update_server_manifest(server_url, filename, file_hash=None):
+    """
+    Patches the cached server file list after a change made by this client,
+    so the next lookup does not need to refetch the whole list.
+
+    Args:
+        server_url (str): The URL of the server.
+        filename (str): The name of the file that changed on the server.
+        file_hash (str): The new hash of the file, or 'None' if the file was deleted.
+    """
+    with _manifest_lock:
+        cached = _manifest_cache.get(server_url)
+        if cached is None:
+            return
+
+        # Copy on write, so readers holding the previous dictionary are not affected
+        server_files = dict(cached[1])
+        if file_hash is None:
+            server_files.pop(filename, None)
+        else:
+            server_files[filename] = file_hash
+        _manifest_cache[server_url] = (cached[0], server_files)
 
 
 def fetch_server_file_mod_time(server_url, filename):
@@ -65,7 +294,7 @@ def fetch_server_file_mod_time(server_url, filename):
     """
     try:
         # Send a GET request to the server to fetch file information
-        response = requests.get(f"{server_url}/file_info/{filename}")
+        response = SESSION.get(f"{server_url}/file_info/{quote(filename)}")
         response.raise_for_status()
 
         # Parse the server's response (expected to be in JSON format)
@@ -77,84 +306,264 @@ def fetch_server_file_mod_time(server_url, filename):
         return mod_time
     
     except requests.RequestException as e:
-        logging.error(f'Error fetching file modification time for \'{filename}\': {e}')
+        logging.error('Error fetching file modification time for \'%s\': %s', filename, e)
         return None
 
 
-def upload_file(server_url, file_path):
+def fetch_server_file_mod_times(server_url, filenames):
     """
-    Uploads a file to the server if it does not already exist or if its hash is different.
+    Fetches the modification times of several files from the server in a single request.
+
+    Args:
+        server_url (str): The URL of the server.
+        filenames (list): The names of the files to check.
+
+    Returns:
+        dict: A dictionary mapping the names of the files that exist on the server to their
+        modification times (Unix timestamps), or 'None' if an error occurs (e.g. the server does
+        not support batched requests).
+    """
+    try:
+        # Send a single POST request listing all the files
+        response = SESSION.post(f"{server_url}/file_info", json={'files': list(filenames)})
+        response.raise_for_status()
+        return response.json()['mod_times']
+
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.error('Error fetching file modification times: %s', e)
+        return None
+
+
+def needs_upload(server_url, file_path, server_files):
+    """
+    Decides whether a local file should be uploaded, by comparing it with the server's copy.
+
+    Args:
+        server_url (str): The URL of the server.
+        file_path (str): The path of the local file.
+        server_files (dict): A dictionary of server file names and their corresponding hashes.
+
+    Returns:
+        str: The hash of the local file if it should be uploaded, or 'None' otherwise.
+    """
+    filename = os.path.basename(file_path)
+
+    # Calculate the local file's hash with the configured algorithm (HASH_ALGORITHM)
+    local_hash = compute_file_hash(file_path)
+    if local_hash is None:
+        return None
+
+    # Case 1: File does not exist on the server, proceed with upload
+    if filename not in server_files:
+        return local_hash
+
+    # Case 2: File exists on the server with the same hash
+    if server_files[filename] == local_hash:
+        logging.info("File \'%s\' already exists on server with matching hash. Skipping upload", filename)
+        return None
+
+    # Case 3: The file exists but the hashes are different, check modification times
+    local_mod_time = os.path.getmtime(file_path)
+    server_mod_time = fetch_server_file_mod_time(server_url, filename)
+
+    if server_mod_time is None:
+        logging.error('Could not fetch modification time for \'%s\'. Skipping', filename)
+        return None
+
+    # If the local file is newer, upload the file
+    if local_mod_time > server_mod_time:
+        logging.info('Local version of \'%s\' is newer. Uploading to server', filename)
+        return local_hash
+
+    logging.info("Server version of \'%s\' is newer or the same. Skipping upload", filename)
+    return None
+
+
+class _ChunkReader:
+    """
+    This class is a read-only file-like object returning the given chunks of a file one after
+    another, so MultipartEncoder can stream them without the data being copied into memory.
+    """
+
+    def __init__(self, file, chunks):
+        """
+        Args:
+            file (file object): The file the chunks are read from, opened in binary mode.
+            chunks (list): Dictionaries with the 'offset' and 'length' of every chunk, in order.
+        """
+        self.file = file
+        self._chunks = iter(chunks)
+        self._chunk_left = 0  # Bytes of the current chunk not read yet
+        self.len = sum(chunk['length'] for chunk in chunks)  # Bytes left to read, as MultipartEncoder expects
+
+    def read(self, size=-1):
+        """
+        Reads the next bytes of the chunks.
+
+        Args:
+            size (int): The maximum number of bytes to read (all of them if negative).
+
+        Returns:
+            bytes: The data read, empty once every chunk was read.
+        """
+        wanted = self.len if size is None or size < 0 else min(size, self.len)
+        pieces = []
+        while wanted > 0:
+            # Move to the next chunk once the current one has been read
+            if not self._chunk_left:
+                chunk = next(self._chunks)
+                self.file.seek(chunk['offset'])
+                self._chunk_left = chunk['length']
+
+            piece = self.file.read(min(wanted, self._chunk_left))
+            if not piece:
+                raise OSError(f'{self.file.name} was truncated during the upload')
+            self._chunk_left -= len(piece)
+            self.len -= len(piece)
+            wanted -= len(piece)
+            pieces.append(piece)
+        return b''.join(pieces)
+
+
+def upload_delta(server_url, file_path, local_hash):
+    """
+    Uploads only the chunks of a file that the server's copy of it does not already have.
+    The server rebuilds the new version from its existing chunks and the uploaded ones.
 
     Args:
         server_url (str): The URL of the server to upload the file to.
         file_path (str): The path of the file to upload.
+        local_hash (str): The hash of the local file, checked by the server after rebuilding it.
 
     Returns:
-        bool: True if the upload was successful, False otherwise.
+        bool: True if the server rebuilt the file successfully, False otherwise.
     """
     filename = os.path.basename(file_path)
     try:
-        # Send a GET request to the server to fetch the list of files already on the server
-        response = requests.get(f"{server_url}/files")
+        # Fetch the content-defined chunks of the server's copy of the file
+        response = SESSION.get(f"{server_url}/file_chunks/{quote(filename)}")
         response.raise_for_status()
+        server_chunks = {chunk['hash'] for chunk in response.json()['chunks']}
 
-        # Get the list of files from the server's response
-        files_data = response.json()['files']
-        
-        # Parse the server response to get a dictionary of filenames and their hashes
-        server_files = {file['filename']: file['hash'] for file in files_data}
-        
-        # Calculate the local file's hash using SHA-256
-        local_hash = compute_file_hash(file_path)
-
-        if filename in server_files:
-            # Case 1: File exists on the server with the same hash
-            if server_files[filename] == local_hash:
-                logging.info(f"File \'{filename}\' already exists on server with matching hash. Skipping upload")
-                return False
-            
-            # Case 2: The file exists but the hashes are different, check modification times
-            local_mod_time = os.path.getmtime(file_path)
-            server_mod_time = fetch_server_file_mod_time(server_url, filename)
-            
-            if server_mod_time is None:
-                logging.error(f'Could not fetch modification time for \'{filename}\'. Skipping')
-                return False
-            
-            # If the local file is newer, upload the file
-            if local_mod_time > server_mod_time:
-                logging.info(f'Local version of \'{filename}\' is newer. Uploading to server')
-                with open(file_path, 'rb') as f:
-                    # Send the file to the server using a POST request
-                    upload_response = requests.post(f"{server_url}/upload", files={'file': f})
-                    upload_response.raise_for_status()
-                    response_data = upload_response.json()
-                    logging.info(f"{response_data['message']}")
-                    return True
-            else:
-                logging.info(f"Server version of \'{filename}\' is newer or the same. Skipping upload")
-                return False
-        
-        else:
-            # Case 3: File does not exist on the server, proceed with upload
-            with open(file_path, 'rb') as f:
-                # Send the file to the server using a POST request
-                upload_response = requests.post(f"{server_url}/upload", files={'file': f})
-                upload_response.raise_for_status()
-                response_data = upload_response.json()
-                logging.info(f"{response_data['message']}")
-                return True
+        # Split the local file the same way and find the chunks the server is missing
+        local_chunks = chunk_file(file_path)
+        missing_chunks = [chunk for chunk in local_chunks if chunk['hash'] not in server_chunks]
+
+        # The manifest lists every chunk of the new version, in order
+        manifest = [[chunk['hash'], chunk['length']] for chunk in local_chunks]
+
+        # Send the data of the missing chunks straight from the file, in the order they appear in it,
+        # instead of collecting it in memory first
+        with open(file_path, 'rb') as f:
+            encoder = MultipartEncoder(fields=[
+                ('filename', filename),
+                ('hash', local_hash),
+                ('manifest', json.dumps(manifest)),
+                ('chunks', ('chunks', _ChunkReader(f, missing_chunks), 'application/octet-stream')),
+            ])
+            patch_response = SESSION.post(f"{server_url}/patch", data=encoder,
+                                          headers={'Content-Type': encoder.content_type})
+        patch_response.raise_for_status()
+        logging.info("Uploaded %s of %s chunks of \'%s\'", len(missing_chunks), len(local_chunks), filename)
+        return True
+
+    except requests.RequestException as e:
+        logging.error('Delta upload of \'%s\' failed, falling back to a full upload: %s', filename, e)
+    except OSError as e:
+        logging.error('Error reading %s for delta upload: %s', file_path, e)
+
+    return False
+
+
+def upload_files(server_url, file_paths):
+    """
+    Uploads a batch of files to the server in a single multipart request.
+    Files that already exist on the server with the same hash, or whose server
+    version is newer, are left out of the batch.
+
+    Args:
+        server_url (str): The URL of the server to upload the files to.
+        file_paths (list): The paths of the files to upload.
+
+    Returns:
+        bool: True if at least one file was uploaded successfully, False otherwise.
+    """
+    try:
+        # Get the dictionary of filenames and their hashes already on the server
+        server_files = get_server_manifest(server_url)
+
+        # Whether any file was sent as a delta instead of as part of the batch
+        delta_uploaded = False
+
+        with ExitStack() as stack:
+            # Collect the files that need uploading, along with their hashes
+            upload_hashes = {}
+            upload_parts = []
+
+            for file_path in file_paths:
+                filename = os.path.basename(file_path)
+                try:
+                    local_hash = needs_upload(server_url, file_path, server_files)
+                    if local_hash is None:
+                        continue
+
+                    # Large files the server already has are patched with only their changed chunks,
+                    # provided they can be split quickly enough (see COMPILED_CHUNKING)
+                    if (COMPILED_CHUNKING and filename in server_files
+                            and os.path.getsize(file_path) >= DELTA_MIN_SIZE
+                            and upload_delta(server_url, file_path, local_hash)):
+                        update_server_manifest(server_url, filename, local_hash)
+                        delta_uploaded = True
+                        continue
+
+                    f = stack.enter_context(open(file_path, 'rb'))
+                except FileNotFoundError:
+                    # The file was removed after the event was queued
+                    logging.error('File not found: %s', file_path)
+                    continue
+
+                upload_hashes[filename] = local_hash
+                upload_parts.append(('file', (filename, f, 'application/octet-stream')))
+
+            if not upload_parts:
+                return delta_uploaded
+
+            # Send all the files to the server using one POST request; the encoder reads the
+            # files while sending instead of building the whole body in memory first
+            encoder = MultipartEncoder(fields=upload_parts)
+            upload_response = SESSION.post(f"{server_url}/upload", data=encoder,
+                                           headers={'Content-Type': encoder.content_type})
+            upload_response.raise_for_status()
+
+        for filename, local_hash in upload_hashes.items():
+            update_server_manifest(server_url, filename, local_hash)
+
+        response_data = upload_response.json()
+        logging.info("%s", response_data['message'])
+        return True
 
     except requests.HTTPError as http_err:
-        logging.error(f'HTTP error occurred while uploading {file_path}: {http_err}')
-    except FileNotFoundError:
-        logging.error(f'File not found: {file_path}')
+        logging.error('HTTP error occurred while uploading %s: %s', file_paths, http_err)
     except Exception as e:
-        logging.error(f'Error uploading {file_path}: {e}')
-    
+        logging.error('Error uploading %s: %s', file_paths, e)
+
     return False
 
 
+def upload_file(server_url, file_path):
+    """
+    Uploads a file to the server if it does not already exist or if its hash is different.
+
+    Args:
+        server_url (str): The URL of the server to upload the file to.
+        file_path (str): The path of the file to upload.
+
+    Returns:
+        bool: True if the upload was successful, False otherwise.
+    """
+    return upload_files(server_url, [file_path])
+
+
 def delete_file(server_url, filename):
     """
     Deletes a file from the server if it exists.
@@ -167,31 +576,32 @@ def delete_file(server_url, filename):
         bool: True if the deletion was successful, False otherwise.
     """
     try:
-        # Send a GET request to the server to fetch the list of files on the server
-        response = requests.get(f"{server_url}/files")
-        response.raise_for_status()
+        # A file missing from the last known file list is definitely not on the server (unless another
+        # client uploaded it since the last synchronization), so skip the request for the file list
+        known_files = get_cached_server_manifest(server_url)
+        if known_files is not None and filename not in known_files:
+            logging.info("File \'%s\' does not exist on server. Skipping deletion", filename)
+            return False
 
-        # Get the list of files from the server's response
-        files_data = response.json()['files']
+        # Get the dictionary of filenames and their hashes on the server
+        server_files = get_server_manifest(server_url)
 
-        # Parse the server's response to get a list of filenames on the server
-        server_files = [file['filename'] for file in files_data]
-        
         # Check if the file exists on the server
         if filename not in server_files:
-            logging.info(f"File \'{filename}\' does not exist on server. Skipping deletion")
+            logging.info("File \'%s\' does not exist on server. Skipping deletion", filename)
         else:
             # If the file exists, send a DELETE request to remove the file
-            delete_response = requests.delete(f"{server_url}/delete/{filename}")
+            delete_response = SESSION.delete(f"{server_url}/delete/{quote(filename)}")
             delete_response.raise_for_status()
+            update_server_manifest(server_url, filename)
             response_data = delete_response.json()
-            logging.info(f"{response_data['message']}")
+            logging.info("%s", response_data['message'])
             return True
 
     except requests.HTTPError as http_err:
-        logging.error(f'HTTP error occurred while deleting \'{filename}\': {http_err}')
+        logging.error('HTTP error occurred while deleting \'%s\': %s', filename, http_err)
     except Exception as e:
-        logging.error(f'Error deleting \'{filename}\' from server: {e}')
+        logging.error('Error deleting \'%s\' from server: %s', filename, e)
 
     return False
 
@@ -208,22 +618,37 @@ def download_file(server_url, filename, local_folder):
     Returns:
         bool: True if the download was successful, False otherwise.
     """
+    file_path = os.path.join(local_folder, filename)
+
+    # Download into a temporary '.part' file next to the destination (ignored by the event handler),
+    # then move it into place, so an interrupted download never leaves a truncated file behind
+    temp_path = file_path + '.part'
     try:
-        # Send a GET request to the server to fetch the file
+        # Send a GET request to the server to fetch the file, accepting a compressed transfer
         # 'stream=True' allows the file to be downloaded in chunks instead of loading it all into memory at once
-        response = requests.get(f"{server_url}/download/{filename}", stream=True)
-        response.raise_for_status()
-        file_path = os.path.join(local_folder, filename)
-        with open(file_path, 'wb') as f:
-            # Iterate over the response content in chunks of the specified size
-            for chunk in response.iter_content(chunk_size=8192):  # 8KB chunks
-                f.write(chunk)  # Write each chunk to the file
-        logging.info(f'Downloaded \'{filename}\' to {file_path}')
+        with SESSION.get(f"{server_url}/download/{quote(filename)}", stream=True,
+                         headers={'Accept-Encoding': 'gzip, deflate'}) as response:
+            response.raise_for_status()
+
+            # Decompress the body on the fly if the server sent it compressed
+            response.raw.decode_content = True
+            with open(temp_path, 'wb') as f:
+                # Copy the response body to the file in 1 MB chunks
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+
+        os.replace(temp_path, file_path)
+        logging.info('Downloaded \'%s\' to %s', filename, file_path)
         return True
 
     except requests.HTTPError as http_err:
-        logging.error(f'HTTP error occurred while downloading \'{filename}\': {http_err}')
+        logging.error('HTTP error occurred while downloading \'%s\': %s', filename, http_err)
     except Exception as e:
-        logging.error(f'Error downloading \'{filename}\': {e}')
+        logging.error('Error downloading \'%s\': %s', filename, e)
+
+    # Clean up the partial download
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
 
     return False
@@ -1,15 +1,16 @@
 """
 The entry point of the synchronization program. Sets up logging, initializes the
-file monitoring observer, and periodically triggers synchronization with the server 
-to keep local and server directories in sync.
+file monitoring observer, and triggers synchronization with the server whenever local
+changes are pushed (and periodically otherwise) to keep local and server directories in sync.
 """
 
-import time
 import logging
+import threading
 from watchdog.observers import Observer
-from config import SERVER_URL, LOCAL_FOLDER, ignore_patterns
+from config import SERVER_URL, LOCAL_FOLDER, SYNC_INTERVAL, ignore_patterns
 from event_handler import ChangeHandler
 from sync_manager import sync_with_server
+from file_utils import IgnoreMatcher
 
 # Set up logging configuration for the program, logging messages with a timestamp
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,8 +22,14 @@ def monitor_folder():
     It starts an observer that watches for file system events in the specified directory.
     """
     
+    # Compile the ignore patterns once, shared by the event handler and every synchronization
+    ignore_matcher = IgnoreMatcher(ignore_patterns)
+
+    # Event set by the event handler when a local change reached the server
+    sync_event = threading.Event()
+
     # Initialize the event handler, passing the server URL and ignore patterns
-    event_handler = ChangeHandler(SERVER_URL, ignore_patterns)
+    event_handler = ChangeHandler(SERVER_URL, ignore_matcher, sync_event)
 
     # Initialize the observer to monitor the file system for changes
     observer = Observer()
@@ -35,9 +42,12 @@ def monitor_folder():
     
     try:
         while True:
-            # Periodically synchronize with the server every 5 seconds
-            sync_with_server(SERVER_URL, LOCAL_FOLDER, ignore_patterns)
-            time.sleep(5)  # Wait for 5 seconds before the next sync
+            sync_with_server(SERVER_URL, LOCAL_FOLDER, ignore_matcher, event_handler.pending_files)
+
+            # Wait until a local change is pushed to the server, or at most SYNC_INTERVAL
+            # seconds to pick up changes made by other clients
+            sync_event.wait(timeout=SYNC_INTERVAL)
+            sync_event.clear()
     except KeyboardInterrupt:
         # Stop the observer if interrupted
         observer.stop()
@@ -5,12 +5,129 @@ necessary file downloads or deletions, resolving conflicts based on file hashes
 """
 
 import os
+import json
+import atexit
 import requests
 import logging
-from file_utils import is_ignored_file, compute_file_hash, fetch_server_file_mod_time, download_file
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import HASH_ALGORITHM
+from file_utils import (get_server_manifest, is_ignored_file, compute_file_hash, fetch_server_file_mod_time,
+                        fetch_server_file_mod_times, download_file)
 
+# File where computed hashes are persisted between runs: {file_path: [mtime_ns, size, hash]}
+# One file per hash algorithm, so switching algorithms never reuses hashes of the other kind
+HASH_CACHE_FILE = f'.synccache-{HASH_ALGORITHM}'
 
-def sync_with_server(server_url, local_folder, ignore_patterns):
+# Maximum number of server files downloaded (or checked for conflicts) concurrently
+DOWNLOAD_WORKERS = 8
+
+# Number of newly computed hashes after which the cache is written back to disk
+HASH_CACHE_FLUSH_INTERVAL = 100
+
+
+def _load_hash_cache():
+    """
+    Loads the persisted hash cache, starting empty if it is missing or unreadable.
+
+    Returns:
+        dict: A dictionary mapping file paths to their [mtime_ns, size, hash] entries.
+    """
+    try:
+        with open(HASH_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+_hash_cache = _load_hash_cache()
+_hash_cache_lock = threading.Lock()
+_hash_cache_unsaved = 0  # Number of entries changed since the cache was last saved
+
+
+def save_hash_cache():
+    """
+    Writes the hash cache to disk, replacing the previous copy atomically.
+    """
+    global _hash_cache_unsaved
+
+    with _hash_cache_lock:
+        data = json.dumps(_hash_cache)
+        _hash_cache_unsaved = 0
+
+    try:
+        temp_path = HASH_CACHE_FILE + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, HASH_CACHE_FILE)
+    except OSError as e:
+        logging.error('Error saving hash cache to %s: %s', HASH_CACHE_FILE, e)
+
+
+# Make sure the latest hashes survive a restart
+atexit.register(save_hash_cache)
+
+
+def cached_file_hash(file_path, stat=None):
+    """
+    Returns the hash of a file, reusing the cached hash if the file's modification time
+    and size have not changed since it was computed.
+
+    Args:
+        file_path (str): The path to the file to hash.
+        stat (os.stat_result): The file's stat result, if already known (fetched otherwise).
+
+    Returns:
+        str: The hash of the file as a hexadecimal string, or None if the file could not be read.
+    """
+    global _hash_cache_unsaved
+
+    if stat is None:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # Let compute_file_hash report the error
+            return compute_file_hash(file_path)
+
+    key = [stat.st_mtime_ns, stat.st_size]
+    with _hash_cache_lock:
+        entry = _hash_cache.get(file_path)
+    if entry is not None and entry[:2] == key:
+        return entry[2]
+
+    # A file that could not be read is not cached, so it is hashed again on the next synchronization
+    file_hash = compute_file_hash(file_path)
+    if file_hash is None:
+        return None
+
+    with _hash_cache_lock:
+        _hash_cache[file_path] = key + [file_hash]
+        _hash_cache_unsaved += 1
+        flush = _hash_cache_unsaved >= HASH_CACHE_FLUSH_INTERVAL
+    if flush:
+        save_hash_cache()
+
+    return file_hash
+
+
+def prune_hash_cache(file_paths):
+    """
+    Drops cached hashes of files that no longer exist locally.
+
+    Args:
+        file_paths (list): The paths of the files currently in the local folder.
+    """
+    global _hash_cache_unsaved
+
+    current_paths = set(file_paths)
+    with _hash_cache_lock:
+        stale_paths = [path for path in _hash_cache if path not in current_paths]
+        for path in stale_paths:
+            del _hash_cache[path]
+        _hash_cache_unsaved += len(stale_paths)
+
+
+def sync_with_server(server_url, local_folder, ignore_patterns, pending_files=None):
     """
     Synchronizes the local folder with the server by fetching the server's file list,
     comparing it with the local files, and handling the necessary file downloads or deletions.
@@ -18,83 +135,144 @@ def sync_with_server(server_url, local_folder, ignore_patterns):
     Args:
         server_url (str): The URL of the server.
         local_folder (str): The path to the local folder to be synchronized.
-        ignore_patterns (list): List of filename patterns to ignore during synchronization.
+        ignore_patterns (IgnoreMatcher or list): Filename patterns to ignore during synchronization.
+        pending_files (callable): Optional function returning the names of the local files queued
+            for upload or being uploaded, which are left untouched by this synchronization.
     """
+    # Files pending upload before the server's file list is fetched may reach the server only after
+    # it was fetched, so they are skipped too, along with the files pending when local files are removed
+    pending_before = pending_files() if pending_files is not None else set()
+
     try:
-        # Send a request to the server to fetch the list of files
-        response = requests.get(f"{server_url}/files")
-        response.raise_for_status()
-        
-        # Get the list of files from the server's response
-        files_data = response.json()['files']
-        
+        # Fetch a fresh copy of the server's file list, which also refreshes the cached copy
+        # used by the event handler
+        files_data = get_server_manifest(server_url, max_age=0)
+
         # Create a dictionary of server files (filename: hash) while ignoring files based on patterns
         server_files = {
-            f['filename']: f['hash']
-            for f in files_data
-            if not is_ignored_file(f['filename'], ignore_patterns)
+            filename: file_hash
+            for filename, file_hash in files_data.items()
+            if not is_ignored_file(filename, ignore_patterns)
         }
 
-        # List all the files in the local folder
-        all_files = os.listdir(local_folder)
-        
-        # Create a dictionary of local files (filename: hash) while ignoring files based on patterns
-        local_files = {
-            f: compute_file_hash(os.path.join(local_folder, f))
-            for f in all_files
-            if not is_ignored_file(f, ignore_patterns)
-        }
-        
+        # Scan the local folder once, keeping regular files that are not ignored along with
+        # their stat results, so no further stat calls are needed for them
+        entries = []
+        with os.scandir(local_folder) as it:
+            for entry in it:
+                if is_ignored_file(entry.name, ignore_patterns):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    entries.append((entry.name, entry.path, entry.stat()))
+                except OSError:
+                    # The file was removed (or became unreadable) since the folder was listed
+                    continue
+        all_files = [name for name, _, _ in entries]
+        file_paths = [path for _, path, _ in entries]
+        file_stats = [stat for _, _, stat in entries]
+
+        # Hash the local files in parallel; hashlib releases the GIL while digesting,
+        # so the worker threads run on separate cores
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            # Create a dictionary of local files (filename: hash); unchanged files reuse their cached hash
+            local_files = dict(zip(all_files, executor.map(cached_file_hash, file_paths, file_stats)))
+        prune_hash_cache(file_paths)
+
+        # Modification times of the local files, reused when resolving conflicts
+        local_mod_times = {name: stat.st_mtime for name, _, stat in entries}
+
+        # Leave the files waiting to be uploaded alone: they are missing from (or outdated on) the
+        # server only because their upload has not completed yet, and will be uploaded anyway.
+        # Files that could not be hashed on either side are left alone as well, until the next synchronization
+        pending = pending_before | (pending_files() if pending_files is not None else set())
+        pending.update(filename for filename, file_hash in local_files.items() if file_hash is None)
+        pending.update(filename for filename, file_hash in server_files.items() if file_hash is None)
+        for filename in pending:
+            local_files.pop(filename, None)
+            server_files.pop(filename, None)
+
         # Remove local files that are not present on the server
         remove_local_files(local_files, server_files, local_folder)
         
         # Handle downloading files from the server to the local folder
-        handle_downloads(server_files, local_files, server_url, local_folder)
+        handle_downloads(server_files, local_files, server_url, local_folder, local_mod_times)
         
     except requests.RequestException as e:
-        logging.error(f'Failed to sync with server: {e}')
+        logging.error('Failed to sync with server: %s', e)
+    except OSError as e:
+        logging.error('Failed to scan local folder %s: %s', local_folder, e)
 
 
-def handle_downloads(server_files, local_files, server_url, local_folder):
+def handle_downloads(server_files, local_files, server_url, local_folder, local_mod_times=None):
     """
     Handles downloading files from the server to the local folder when necessary.
     This includes downloading missing files and resolving conflicts based on file hash
-    and modification times.
+    and modification times. Files are handled concurrently, sharing the pooled connections
+    of the HTTP session, so the total time no longer grows with one round-trip per file.
 
     Args:
         server_files (dict): A dictionary of server file names and their corresponding hashes.
         local_files (dict): A dictionary of local file names and their corresponding hashes.
         server_url (str): The URL of the server to download files from.
         local_folder (str): The path to the local folder where files will be downloaded.
+        local_mod_times (dict): Optional dictionary of local file names and their modification times.
     """
-    for filename, server_hash in server_files.items():
+    # Fetch the server modification times of all the conflicting files (same name, different hash)
+    # in one request, instead of one request per file
+    conflicting_files = [
+        filename for filename, server_hash in server_files.items()
+        if filename in local_files and local_files[filename] != server_hash
+    ]
+    server_mod_times = fetch_server_file_mod_times(server_url, conflicting_files) if conflicting_files else {}
+
+    def handle_server_file(filename, server_hash):
+        """
+        Downloads a single server file if it is missing locally or if the server version is newer.
+
+        Args:
+            filename (str): The name of the file on the server.
+            server_hash (str): The hash of the server's version of the file.
+        """
         local_file_path = os.path.join(local_folder, filename)
 
         # Case 1: File is missing locally, so download from server
         if filename not in local_files:
-            logging.info(f'Downloading \'{filename}\' from server (not found locally)')
+            logging.info('Downloading \'%s\' from server (not found locally)', filename)
             if not download_file(server_url, filename, local_folder):
-                logging.error(f'Failed to download \'{filename}\'')
+                logging.error('Failed to download \'%s\'', filename)
 
         else:
             # Case 2: File exists locally, check for hash mismatch
             local_hash = local_files[filename]
             if local_hash != server_hash:
-                logging.info(f'Hash mismatch for \'{filename}\', checking modification times to resolve conflict')
+                logging.info('Hash mismatch for \'%s\', checking modification times to resolve conflict', filename)
 
                 # Fetch modification times
-                local_mod_time = os.path.getmtime(local_file_path)
-                server_mod_time = fetch_server_file_mod_time(server_url, filename)
+                if local_mod_times is not None and filename in local_mod_times:
+                    local_mod_time = local_mod_times[filename]
+                else:
+                    local_mod_time = os.path.getmtime(local_file_path)
+                if server_mod_times is not None:
+                    server_mod_time = server_mod_times.get(filename)
+                else:
+                    # The batched request failed, so ask for this file alone
+                    server_mod_time = fetch_server_file_mod_time(server_url, filename)
 
                 if server_mod_time is None:
-                    logging.error(f'Could not fetch modification time for \'{filename}\'. Skipping')
-                    continue  # Skip to the next file
+                    logging.error('Could not fetch modification time for \'%s\'. Skipping', filename)
+                    return  # Skip to the next file
 
                 # If server version is newer, download it
                 if local_mod_time < server_mod_time:
-                    logging.info(f'Server version of \'{filename}\' is newer. Downloading to local folder')
+                    logging.info('Server version of \'%s\' is newer. Downloading to local folder', filename)
                     if not download_file(server_url, filename, local_folder):
-                        logging.error(f'Failed to download \'{filename}\'')
+                        logging.error('Failed to download \'%s\'', filename)
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        # Consume the results so that unexpected errors are raised here, as before
+        list(executor.map(handle_server_file, server_files.keys(), server_files.values()))
 
 
 def remove_local_files(local_files, server_files, local_folder):
@@ -110,9 +288,9 @@ def remove_local_files(local_files, server_files, local_folder):
 
         # If a file is present locally but not on the server, remove it
         if filename not in server_files:
-            logging.info(f'Local file \'{filename}\' not on server. Removing it')
+            logging.info('Local file \'%s\' not on server. Removing it', filename)
             try:
                 os.remove(os.path.join(local_folder, filename))
-                logging.info(f'Successfully removed \'{filename}\' from local folder')
+                logging.info('Successfully removed \'%s\' from local folder', filename)
             except Exception as e:
-                logging.error(f'Error removing \'{filename}\': {e}')
+                logging.error('Error removing \'%s\': %s', filename, e)
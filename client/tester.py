@@ -12,9 +12,9 @@ def create_test_file(folder, filename, content="This is a test file."):
         file_path = os.path.join(folder, filename)
         with open(file_path, 'w') as f:
             f.write(content)
-        logging.info(f"Created file: {file_path}")
+        logging.info("Created file: %s", file_path)
     except Exception as e:
-        logging.error(f"Could not create file {filename}. Error: {e}")
+        logging.error("Could not create file %s. Error: %s", filename, e)
 
 
 def modify_test_file(folder, filename, content="\nModified content."):
@@ -22,9 +22,9 @@ def modify_test_file(folder, filename, content="\nModified content."):
         file_path = os.path.join(folder, filename)
         with open(file_path, 'a') as f:
             f.write(content)
-        logging.info(f"Modified file: {file_path}")
+        logging.info("Modified file: %s", file_path)
     except Exception as e:
-        logging.error(f"Could not modify file {filename}. Error: {e}")
+        logging.error("Could not modify file %s. Error: %s", filename, e)
 
 
 def rename_test_file(folder, old_filename, new_filename):
@@ -32,18 +32,18 @@ def rename_test_file(folder, old_filename, new_filename):
         old_file_path = os.path.join(folder, old_filename)
         new_file_path = os.path.join(folder, new_filename)
         os.rename(old_file_path, new_file_path)
-        logging.info(f"Renamed file from {old_file_path} to {new_file_path}")
+        logging.info("Renamed file from %s to %s", old_file_path, new_file_path)
     except Exception as e:
-        logging.error(f"Could not rename file {old_filename} to {new_filename}. Error: {e}")
+        logging.error("Could not rename file %s to %s. Error: %s", old_filename, new_filename, e)
 
 
 def delete_test_file(folder, filename):
     try:
         file_path = os.path.join(folder, filename)
         os.remove(file_path)
-        logging.info(f"Deleted file: {file_path}")
+        logging.info("Deleted file: %s", file_path)
     except Exception as e:
-        logging.error(f"Could not delete file {filename}. Error: {e}")
+        logging.error("Could not delete file %s. Error: %s", filename, e)
 
 
 def create_large_file(folder, filename, size_mb):
@@ -51,9 +51,9 @@ def create_large_file(folder, filename, size_mb):
         file_path = os.path.join(folder, filename)
         with open(file_path, 'wb') as f:
             f.write(os.urandom(size_mb * 1024 * 1024))  # Random binary data
-        logging.info(f"Created large file: {file_path} ({size_mb} MB)")
+        logging.info("Created large file: %s (%s MB)", file_path, size_mb)
     except Exception as e:
-        logging.error(f"Could not create large file {filename}. Error: {e}")
+        logging.error("Could not create large file %s. Error: %s", filename, e)
 
 
 def stress_test(folder, file_count=100, sync_wait=5):
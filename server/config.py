@@ -1,6 +1,6 @@
 """
 This file configures the application by specifying the directory path (sync_folder) where uploaded files will be stored. 
-It creates the directory if it does not already exist.
+It creates the directory if it does not already exist, and opens it once for the whole server.
 """
 
 import os
@@ -8,4 +8,17 @@ import os
 # Path to the shared folder where files will be stored
 SYNC_FOLDER = ''
 
+# Algorithm used to fingerprint files: 'blake3' (requires the 'blake3' package) or 'sha256'.
+# It must be the same on the client and the server; 'sha256' keeps compatibility with
+# clients and servers that have not been migrated yet
+HASH_ALGORITHM = 'blake3'
+
 os.makedirs(SYNC_FOLDER, exist_ok=True)
+
+# Descriptor of the synchronized folder, opened once so that file operations can resolve names
+# relative to it ('dir_fd') instead of walking the whole folder path every time.
+# It is None on platforms where file operations do not support 'dir_fd' (e.g. Windows)
+if {os.open, os.stat, os.unlink, os.rename} <= os.supports_dir_fd:
+    SYNC_FD = os.open(SYNC_FOLDER, os.O_RDONLY | os.O_DIRECTORY)
+else:
+    SYNC_FD = None
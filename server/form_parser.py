@@ -0,0 +1,190 @@
+"""
+This module implements a streaming parser for 'multipart/form-data' request bodies.
+The body is read in fixed-size blocks and every part is written to its destination as soon as
+it arrives, so memory use stays at one block regardless of the size of the upload. Boundaries
+and header blocks are located with 'bytearray.find', which scans in C instead of byte by byte.
+"""
+
+import re
+
+# Number of bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+# Maximum size of the header block of a part
+MAX_HEADER_SIZE = 16 * 1024
+
+# Matches the 'key=value' parameters of a header, where the value may be a quoted string
+_PARAM_RE = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+def parse_header_params(value):
+    """
+    Parses the parameters of a header value such as 'form-data; name="file"; filename="a.txt"'.
+
+    Args:
+        value (str): The header value.
+
+    Returns:
+        dict: The parameters, with lowercase keys and unquoted values.
+    """
+    params = {}
+    for key, param in _PARAM_RE.findall(value):
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = param[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        params[key.lower()] = param
+    return params
+
+
+def _parse_part_headers(block):
+    """
+    Parses the header block of a part.
+
+    Args:
+        block (bytes-like): The header lines of the part, without the blank line ending them.
+
+    Returns:
+        tuple: The 'name' and 'filename' of the part ('filename' is None for plain fields).
+    """
+    name, filename = None, None
+    for line in block.decode('utf-8', 'replace').split('\r\n'):
+        key, _, value = line.partition(':')
+        if key.strip().lower() == 'content-disposition':
+            params = parse_header_params(value)
+            name = params.get('name')
+            filename = params.get('filename')
+    return name, filename
+
+
+def _write_all(sink, data):
+    """
+    Writes the whole buffer to a sink, which may be a raw (unbuffered) file that writes only part
+    of the data in one call.
+
+    Args:
+        sink (file object): The writable file object.
+        data (memoryview): The data to write.
+    """
+    while data:
+        written = sink.write(data)
+        if written is None or written >= len(data):
+            return
+        data = data[written:]
+
+
+def parse_form_data(rfile, content_length, boundary, open_part):
+    """
+    Reads a 'multipart/form-data' body and streams every part into a destination chosen by the caller.
+
+    Args:
+        rfile (file object): The stream the request body is read from.
+        content_length (int): The length of the request body in bytes.
+        boundary (str): The boundary separating the parts, from the Content-Type header.
+        open_part (callable): Called with the 'name' and 'filename' of each part ('filename' is
+            None for plain fields); returns a writable file object receiving the content of the
+            part, or None to discard it. Raw (unbuffered) files are supported, so the data can be
+            written to disk without copying it through another buffer.
+
+    Returns:
+        list: A list of (name, filename, file object) tuples for the parts that were kept, in order.
+
+    Raises:
+        ValueError: If the body is not a well-formed multipart body.
+    """
+    delimiter = b'\r\n--' + boundary.encode('latin-1')
+    if len(delimiter) > MAX_HEADER_SIZE:
+        raise ValueError('Multipart boundary too long')
+
+    # Number of bytes kept back at the end of the buffer while searching for a delimiter,
+    # since the delimiter may be split across two reads
+    keep = len(delimiter) - 1
+
+    parts = []
+    sink = None
+    remaining = content_length
+
+    # Single buffer reused for the whole body: every read fills it in place, after the bytes
+    # still waiting to be parsed (at most one header block) are moved to its start
+    buf = bytearray(READ_SIZE + MAX_HEADER_SIZE)
+
+    # The body starts with the first delimiter, which is not preceded by a line break;
+    # prepending one lets every delimiter be found the same way
+    buf[:2] = b'\r\n'
+    pos, filled = 0, 2
+    state = 'preamble'
+
+    with memoryview(buf) as view:
+        while True:
+            if state == 'preamble':
+                index = buf.find(delimiter, pos, filled)
+                if index >= 0:
+                    pos = index + len(delimiter)
+                    state = 'delimiter'
+                    continue
+
+                # Skip the data before the first delimiter, keeping a possible partial delimiter
+                pos = max(pos, filled - keep)
+
+            elif state == 'delimiter':
+                # A delimiter is followed by a line break before the next part, or by '--' at the end
+                if filled - pos >= 2:
+                    marker = bytes(view[pos:pos + 2])
+                    pos += 2
+                    if marker == b'--':
+                        # Read and discard the epilogue, so the connection is left at the end of the body
+                        while remaining > 0:
+                            count = rfile.readinto(view[:min(len(buf), remaining)])
+                            if not count:
+                                break
+                            remaining -= count
+                        return parts
+                    if marker != b'\r\n':
+                        raise ValueError('Malformed multipart delimiter')
+                    state = 'headers'
+                    continue
+
+            elif state == 'headers':
+                index = buf.find(b'\r\n\r\n', pos, filled)
+                if index >= 0:
+                    name, filename = _parse_part_headers(bytes(view[pos:index]))
+                    pos = index + 4
+                    sink = open_part(name, filename)
+                    if sink is not None:
+                        parts.append((name, filename, sink))
+                    state = 'data'
+                    continue
+
+                # Header blocks are small; refuse to buffer an unbounded one
+                if filled - pos >= MAX_HEADER_SIZE:
+                    raise ValueError('Multipart headers too large')
+
+            elif state == 'data':
+                index = buf.find(delimiter, pos, filled)
+                end = index if index >= 0 else max(pos, filled - keep)
+
+                # Write everything up to the delimiter, or up to a possible partial delimiter
+                if sink is not None and end > pos:
+                    _write_all(sink, view[pos:end])
+                pos = end
+
+                if index >= 0:
+                    pos = index + len(delimiter)
+                    sink = None
+                    state = 'delimiter'
+                    continue
+
+            # More data is needed: move the unparsed bytes to the start of the buffer
+            # and read the next block right after them
+            if remaining <= 0:
+                raise ValueError('Multipart body ended unexpectedly')
+
+            if pos:
+                view[:filled - pos] = view[pos:filled]
+                filled -= pos
+                pos = 0
+
+            count = rfile.readinto(view[filled:filled + min(READ_SIZE, remaining)])
+            if not count:
+                raise ValueError('Multipart body ended unexpectedly')
+            remaining -= count
+            filled += count
@@ -5,12 +5,234 @@ and deleting files in a synchronized folder.
 """
 
 import os
+import io
+import re
+import posixpath
 import json
-import cgi
+import time
 import logging
+import tempfile
+import threading
+from urllib.parse import urlsplit, unquote, quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http.server import BaseHTTPRequestHandler
-from config import SYNC_FOLDER
-from file_utils import compute_file_hash
+from config import SYNC_FOLDER, SYNC_FD
+from file_utils import new_hash, cached_file_hash, prune_hash_cache, store_file_hash, HashingWriter
+from cdc import chunk_file, COMPILED_CHUNKING
+from form_parser import parse_form_data
+
+# orjson is optional: when it is installed, JSON is encoded and decoded with it (several times
+# faster than the standard library), otherwise the 'json' module is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+# Threads hashing new or changed files for '/files' requests, shared by all requests so
+# concurrent listings cannot multiply the number of hashing threads
+_HASH_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() * 2))
+
+# Number of seconds a serialized '/files' response is reused for repeated requests
+LISTING_TTL = 1
+
+# Maximum size in bytes of a JSON request body
+MAX_JSON_BODY = 1024 * 1024
+
+# Maximum sizes in bytes of the short text fields of a '/patch' request ('filename' and 'hash'),
+# and of its manifest (about 80 bytes per 16 KB chunk, so enough for files of several GB)
+MAX_FIELD_SIZE = 4 * 1024
+MAX_MANIFEST_SIZE = 32 * 1024 * 1024
+
+# Version of the synchronized folder, bumped whenever a request changes its content
+_folder_version = 0
+
+# Last serialized '/files' response: (folder version, monotonic time, body), or None
+_listing_cache = None
+_listing_lock = threading.Lock()
+
+# Name prefix and suffix of the temporary files receiving uploads in the synchronized folder,
+# which are left out of the '/files' listing until they are moved into place
+TEMP_PREFIX = '.sync-'
+TEMP_SUFFIX = '.part'
+
+# Permissions of received files, as 'open' would create them under the process umask ('mkstemp'
+# creates owner-only files); the umask can only be read by setting it, so this is done once at import
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def _dumps(message):
+    """
+    Serializes a message to JSON.
+
+    Args:
+        message (dict): The message to serialize.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message).encode()
+
+
+def _loads(data):
+    """
+    Parses a JSON document.
+
+    Args:
+        data (bytes): The JSON document.
+
+    Returns:
+        The parsed value.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _create_temp_file():
+    """
+    Creates a temporary file in the synchronized folder, with the permissions of a regular file,
+    so it can be moved into place once complete.
+
+    Returns:
+        tuple: The file descriptor and the path of the temporary file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=SYNC_FOLDER, prefix=TEMP_PREFIX, suffix=TEMP_SUFFIX)
+    if hasattr(os, 'fchmod'):
+        os.fchmod(fd, FILE_MODE)
+    return fd, temp_path
+
+
+class _BoundedWriter:
+    """
+    This class wraps a writable file receiving a form field and refuses fields larger than a limit,
+    so a client cannot make the server buffer an arbitrarily large field.
+    """
+
+    def __init__(self, file, limit):
+        """
+        Args:
+            file (file object): The file receiving the field.
+            limit (int): The maximum size of the field in bytes.
+        """
+        self.file = file
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data):
+        """
+        Writes data to the file.
+
+        Args:
+            data (bytes-like): The data to write.
+
+        Returns:
+            int: The number of bytes written.
+
+        Raises:
+            ValueError: If the field exceeds the limit.
+        """
+        self.size += len(data)
+        if self.size > self.limit:
+            raise ValueError('Form field too large')
+        return self.file.write(data)
+
+    def read_all(self):
+        """
+        Returns:
+            bytes: The whole content of the field.
+        """
+        self.file.seek(0)
+        return self.file.read()
+
+
+def _valid_manifest(manifest):
+    """
+    Checks that a delta manifest received from a client is a list of [chunk hash, chunk length] pairs.
+
+    Args:
+        manifest: The decoded manifest.
+
+    Returns:
+        bool: True if every entry is a pair of a string and a non-negative integer, False otherwise.
+    """
+    if not isinstance(manifest, list):
+        return False
+    for entry in manifest:
+        if not (isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str)
+                and type(entry[1]) is int and entry[1] >= 0):
+            return False
+    return True
+
+
+def sync_path(filename):
+    """
+    Returns the path of a file in the synchronized folder.
+
+    Args:
+        filename (str): The name of the file, as sent by the client.
+
+    Returns:
+        str: The path of the file, or None if the name is not a plain file name (empty, '.', '..'
+        or containing a path separator) and could address a file outside the synchronized folder.
+    """
+    if filename in ('', '.', '..') or '\0' in filename:
+        return None
+
+    # A plain file name is its own base name, both with '/' and with the platform's separators
+    if posixpath.basename(filename) != filename or os.path.basename(filename) != filename:
+        return None
+
+    return os.path.join(SYNC_FOLDER, filename)
+
+
+def _content_disposition(filename):
+    """
+    Builds the Content-Disposition header of a download. Header values are sent as latin-1, so the
+    name is given as an ASCII fallback plus its UTF-8 percent-encoded form (RFC 6266).
+
+    Args:
+        filename (str): The name of the downloaded file.
+
+    Returns:
+        str: The header value.
+    """
+    # Replace the characters that cannot appear in a quoted ASCII string, and escape the others
+    fallback = ''.join(c if ' ' <= c < '\x7f' else '_' for c in filename)
+    fallback = fallback.replace('\\', '\\\\').replace('"', '\\"')
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def _sync_name(filename, file_path):
+    """
+    Returns the name to pass to a file operation called with 'dir_fd=SYNC_FD': the bare filename,
+    resolved by the kernel relative to the open synchronized folder, or the full path where
+    'dir_fd' is not supported.
+
+    Args:
+        filename (str): The name of the file, already checked with 'sync_path'.
+        file_path (str): The path of the file, as returned by 'sync_path'.
+
+    Returns:
+        str: The name to pass to the file operation.
+    """
+    return file_path if SYNC_FD is None else filename
+
+
+def _folder_changed():
+    """
+    Marks the content of the synchronized folder as changed, invalidating the cached '/files' response.
+    """
+    global _folder_version, _listing_cache
+
+    with _listing_lock:
+        _folder_version += 1
+        _listing_cache = None
 
 
 class RequestHandler(BaseHTTPRequestHandler):
@@ -19,6 +241,82 @@ class RequestHandler(BaseHTTPRequestHandler):
     managing files in the synchronized folder. It supports file uploads (POST), downloads (GET),
     listing files (GET), fetching file information (GET), and deleting files (DELETE).
     """
+
+    # Routes of each request method: (pattern of the request path, name of the handler method)
+    # The patterns are compiled once; the filename captured by a pattern is passed to the handler
+    _GET_ROUTES = (
+        (re.compile(r'/download/(.+)'), 'handle_download'),
+        (re.compile(r'/files'), 'handle_files_list'),
+        (re.compile(r'/file_info/(.+)'), 'handle_file_info'),
+        (re.compile(r'/file_chunks/(.+)'), 'handle_file_chunks'),
+    )
+    _POST_ROUTES = (
+        (re.compile(r'/upload'), 'handle_upload'),
+        (re.compile(r'/patch'), 'handle_patch'),
+        (re.compile(r'/file_info'), 'handle_file_info_batch'),
+    )
+    _DELETE_ROUTES = (
+        (re.compile(r'/delete/(.+)'), 'handle_delete'),
+    )
+
+    # Keep connections open between requests, so clients polling the server reuse one connection
+    # instead of paying for a new TCP handshake on every request; this requires every response
+    # to carry a Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    # Buffer writes to the socket (the default is unbuffered), so the status line, the headers and
+    # small response bodies go out in a single send instead of one system call per write
+    wbufsize = 64 * 1024
+
+    # Close connections on which nothing is received for this many seconds, so a stalled
+    # client cannot hold one of the server's worker threads indefinitely
+    timeout = 60
+
+    # Close kept-alive connections on which no new request starts within this many seconds:
+    # every open connection holds one of the server's worker threads, so idle connections
+    # must release them quickly for other clients to be served
+    keep_alive_timeout = 5
+
+    def handle(self):
+        """
+        Handle the requests of a connection, waiting at most 'keep_alive_timeout' seconds
+        between two requests and 'timeout' seconds within a request.
+        """
+        self.handle_one_request()
+        while not self.close_connection:
+            # Wait for the first byte of the next request with the shorter idle timeout
+            self.connection.settimeout(self.keep_alive_timeout)
+            try:
+                if not self.rfile.peek(1):
+                    break
+            except OSError:
+                # Timed out (or reset) while idle: close the connection quietly
+                break
+            self.connection.settimeout(self.timeout)
+            self.handle_one_request()
+
+    def log_message(self, format, *args):
+        """
+        Logs a request at DEBUG level through the module logger, instead of writing
+        every request line to stderr.
+
+        Args:
+            format (str): The format string of the message.
+            *args: The arguments of the format string.
+        """
+        # Only formatted if DEBUG messages are enabled
+        log.debug('%s - ' + format, self.address_string(), *args)
+
+    def log_error(self, format, *args):
+        """
+        Logs an error (e.g. a malformed request or a timeout) at WARNING level through the module logger.
+
+        Args:
+            format (str): The format string of the message.
+            *args: The arguments of the format string.
+        """
+        log.warning('%s - ' + format, self.address_string(), *args)
+
     def _send_response(self, status_code, message, content_type='application/json'):
         """
         Helper function to send JSON responses.
@@ -29,62 +327,315 @@ class RequestHandler(BaseHTTPRequestHandler):
             content_type (str): The content type of the response (default is 'application/json').
         """
 
+        # Write the JSON-encoded message to the response body
+        # The message is serialized straight into bytes
+        self._send_body(status_code, _dumps(message), content_type)
+
+    def _send_body(self, status_code, body, content_type='application/json'):
+        """
+        Helper function to send a response whose body is already serialized.
+
+        Args:
+            status_code (int): HTTP status code to send (e.g., 200, 404).
+            body (bytes): The response body.
+            content_type (str): The content type of the response (default is 'application/json').
+        """
+
         # Send the HTTP status code (e.g., 200 for success, 404 for not found)
         self.send_response(status_code)
 
         # Add a header specifying the content type of the response (default is JSON)
         self.send_header('Content-type', content_type)
 
+        # Add the length of the body, so the client knows where the response ends on a kept-alive connection
+        self.send_header('Content-Length', str(len(body)))
+
         # End the headers section, indicating that the header information is complete
         self.end_headers()
 
-        # Write the JSON-encoded message to the response body
-        # The message is serialized into a JSON string and then encoded into bytes
-        self.wfile.write(json.dumps(message).encode())
+        self.wfile.write(body)
+
+    def _route(self, routes):
+        """
+        Helper function to find the handler of the request in a routing table.
+        For example, '/download/a%20b.txt' is routed to 'handle_download' with the argument 'a b.txt'.
+
+        Args:
+            routes (tuple): The (compiled pattern, handler method name) pairs of the request method.
+
+        Returns:
+            tuple: The bound handler method and the list of its (percent-decoded) arguments,
+            or (None, None) if no route matches the request path.
+        """
+        path = urlsplit(self.path).path
+        for pattern, handler_name in routes:
+            match = pattern.fullmatch(path)
+            if match:
+                return getattr(self, handler_name), [unquote(group) for group in match.groups()]
+        return None, None
+
+    def _file_path(self, filename):
+        """
+        Helper function to get the path of a file addressed by a request. If the filename is not
+        a plain file name, a 400 error is sent.
+
+        Args:
+            filename (str): The name of the file.
+
+        Returns:
+            str: The path of the file in the synchronized folder, or None if the request was rejected.
+        """
+        file_path = sync_path(filename)
+        if file_path is None:
+            self._send_response(400, {'error': f'Invalid filename \'{filename}\''})
+        return file_path
 
     def do_POST(self):
         """
         Handle POST requests for file uploads.
 
-        This method processes incoming file uploads. It checks if the request is a
-        multipart form data, extracts the file, and saves it to the synchronized folder.
+        Requests to '/upload' carry whole files and are handled by 'handle_upload'.
+        Requests to '/patch' carry delta uploads and are handled by 'handle_patch'.
+        Requests to '/file_info' ask for the modification times of several files and are handled
+        by 'handle_file_info_batch'.
+        """
+
+        # Find the handler of the request path in the POST routing table and call it
+        handler, args = self._route(self._POST_ROUTES)
+        if handler is None:
+            # The request body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_response(404, {'error': 'Not found'})
+            return
+
+        handler(*args)
+
+    def _parse_form(self, open_part):
+        """
+        Helper function to stream a 'multipart/form-data' request body into the destinations
+        chosen by 'open_part'. If the request is not a well-formed multipart request, a 400 error
+        is sent.
+
+        Args:
+            open_part (callable): Called with the 'name' and 'filename' of each part; returns a
+                writable file object receiving the content of the part, or None to discard it.
+
+        Returns:
+            list: The (name, filename, file object) tuples of the kept parts, or None if the request
+            was rejected.
+        """
+
+        # Ensure that the content type is 'multipart/form-data' and get the boundary between the parts
+        boundary = self.headers.get_param('boundary')
+        if self.headers.get_content_type() != 'multipart/form-data' or not boundary:
+            # The request body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_response(400, {'error': 'Expected a multipart/form-data request'})
+            return None
+
+        try:
+            content_length = int(self.headers['Content-Length'])
+            return parse_form_data(self.rfile, content_length, boundary, open_part)
+        except (TypeError, ValueError) as e:
+            # The rest of the request body is unknown, so the connection cannot be reused
+            self.close_connection = True
+            self._send_response(400, {'error': f'Malformed request body: {e}'})
+            return None
+
+    def handle_upload(self):
+        """
+        Handle file uploads.
+
+        This method streams every 'file' part of the request into a temporary file in the
+        synchronized folder, and moves the temporary files into place once the whole request
+        has been received, so an interrupted upload never leaves a truncated file behind.
         """
 
-        # Check if the request path is '/upload' to handle file upload requests
-        if self.path == '/upload':
+        # Temporary files receiving the uploaded files: (filename, temporary path, file object)
+        uploads = []
+
+        # Filenames that cannot be stored in the synchronized folder
+        invalid_filenames = []
+
+        def open_part(name, filename):
+            # Keep only the fields that actually carry a file (i.e. filename is not empty)
+            if name != 'file' or not filename:
+                return None
+
+            # Discard files whose name could address a file outside the synchronized folder
+            if sync_path(filename) is None:
+                invalid_filenames.append(filename)
+                return None
+
+            # The parser already writes in large blocks, so the file is opened unbuffered and every
+            # block goes straight to a write call instead of being copied into a buffer first.
+            # The file is hashed as it is written, so it never has to be read back for '/files'
+            fd, temp_path = _create_temp_file()
+            temp_file = HashingWriter(os.fdopen(fd, 'wb', buffering=0))
+            uploads.append((filename, temp_path, temp_file))
+            return temp_file
+
+        try:
+            # Parse the request body, writing the file contents to disk as they arrive
+            parts = self._parse_form(open_part)
+
+            # The stat results of the received files, taken before closing them; renaming keeps them valid
+            stats = [os.fstat(temp_file.fileno()) for _, _, temp_file in uploads]
+
+            for _, _, temp_file in uploads:
+                temp_file.close()
+
+            if parts is None:
+                return
+
+            # Reject the whole batch if any of the files cannot be stored
+            if invalid_filenames:
+                self._send_response(400, {'error': f'Invalid filename \'{invalid_filenames[0]}\''})
+                return
 
-            # Parse the Content-Type header to check if it's 'multipart/form-data', typically used for file uploads
-            content_type, _ = cgi.parse_header(self.headers['Content-Type'])
+            # Check if at least one file was uploaded
+            if not uploads:
+                self._send_response(400, {'error': 'No file uploaded'})
+                return
 
-            # Ensure that the content type is 'multipart/form-data', which indicates a file upload
-            if content_type == 'multipart/form-data':
+            for (filename, temp_path, temp_file), stat in zip(uploads, stats):
 
-                # Parse the request body to extract the file data
-                # 'rfile' contains the body of the POST request, including the file content
-                request_data = cgi.FieldStorage(fp=self.rfile, headers=self.headers, environ={'REQUEST_METHOD': 'POST'})
+                # Construct the full file path where the file should be saved (in the sync folder)
+                # and move the received file there
+                file_path = sync_path(filename)
+                os.replace(temp_path, _sync_name(filename, file_path), dst_dir_fd=SYNC_FD)
 
-                # Retrieve the file data from the request
-                file_item = request_data['file']
+                # Record the hash computed while receiving the file
+                store_file_hash(file_path, temp_file.hexdigest(), stat)
 
-                # Check if the file was uploaded (i.e., filename is not empty)
-                if file_item.filename:
+                log.info("Uploaded '%s'", filename)
 
-                    # Extract the filename and read the file content
-                    filename = file_item.filename
-                    file_data = file_item.file.read()
+        finally:
+            # Remove the temporary files that were not moved into place
+            for _, temp_path, temp_file in uploads:
+                temp_file.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
 
-                    # Construct the full file path where the file should be saved (in the sync folder)
-                    file_path = os.path.join(SYNC_FOLDER, filename)
+        _folder_changed()
 
-                    # Open the destination file in write-binary mode and save the uploaded content
-                    with open(file_path, 'wb') as f:
-                        f.write(file_data)
+        if len(uploads) == 1:
+            message = f'File \'{uploads[0][0]}\' uploaded successfully'
+        else:
+            message = f'{len(uploads)} files uploaded successfully'
+        self._send_response(200, {'message': message})
+
+    def handle_patch(self):
+        """
+        Handle delta uploads.
+
+        The request carries the ordered list of chunks ('manifest') making up the new version
+        of a file, plus the data of the chunks missing from the server's copy ('chunks').
+        The new version is rebuilt into a temporary file from both sources, checked against
+        the expected hash, and then moved into place.
+        """
+
+        def open_part(name, filename):
+            # The data of the missing chunks may be large, so it is spooled to disk past 1 MB,
+            # like the manifest; the other fields are short, and unknown fields are discarded
+            if name == 'chunks':
+                return tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            if name == 'manifest':
+                return _BoundedWriter(tempfile.SpooledTemporaryFile(max_size=1024 * 1024), MAX_MANIFEST_SIZE)
+            if name in ('filename', 'hash'):
+                return _BoundedWriter(io.BytesIO(), MAX_FIELD_SIZE)
+            return None
+
+        # Rebuilding the file means splitting the server's copy, which is too slow without compiled chunking
+        if not COMPILED_CHUNKING:
+            self.close_connection = True
+            self._send_response(501, {'error': 'Delta transfers are not supported by this server'})
+            return
+
+        # Parse the multipart request body
+        parts = self._parse_form(open_part)
+        if parts is None:
+            return
+
+        # Keep the first part of each name, like 'getfirst'
+        fields = {}
+        for name, _, part in reversed(parts):
+            fields[name] = part
+
+        try:
+            filename = fields['filename'].read_all().decode() if 'filename' in fields else ''
+            expected_hash = fields['hash'].read_all().decode() if 'hash' in fields else ''
+            manifest = _loads(fields['manifest'].read_all()) if 'manifest' in fields else []
+        except ValueError:
+            manifest = None
+
+        # The manifest must be a list of [chunk hash, chunk length] pairs
+        if not _valid_manifest(manifest):
+            self._send_response(400, {'error': 'Expected a manifest of the form [[hash, length], ...]'})
+            return
+
+        new_chunks = fields.get('chunks')
+        if new_chunks is not None:
+            new_chunks.seek(0)
 
-                    logging.info(f"Uploaded \'{filename}\'")
-                    self._send_response(200, {'message': f'File \'{filename}\' uploaded successfully'})
+        # Create the full file path by joining the synchronized folder path with the filename
+        file_path = self._file_path(filename)
+        if file_path is None:
+            return
 
-                else:
-                    self._send_response(400, {'error': 'No file uploaded'})
+        # A delta can only be applied on top of an existing file
+        if new_chunks is None:
+            self._send_response(404, {'error': 'File not found'})
+            return
+
+        # Map the hashes of the chunks of the server's copy to their location in it, and open it to
+        # copy them; a missing file (possibly deleted meanwhile) is reported by opening it
+        try:
+            server_chunks = {chunk['hash']: chunk for chunk in chunk_file(file_path)}
+            old_file = open(file_path, 'rb')
+        except FileNotFoundError:
+            self._send_response(404, {'error': 'File not found'})
+            return
+
+        # Rebuild the file next to the original, so the final rename is atomic,
+        # and hash it as it is written, instead of reading it back to check it
+        with old_file:
+            fd, temp_path = _create_temp_file()
+            file_hash = new_hash()
+            try:
+                with os.fdopen(fd, 'wb') as new_file:
+                    for chunk_hash, length in manifest:
+                        chunk = server_chunks.get(chunk_hash)
+
+                        # Reuse the chunk from the server's copy if it has it, otherwise take it from the request
+                        if chunk is not None:
+                            old_file.seek(chunk['offset'])
+                            data = old_file.read(chunk['length'])
+                        else:
+                            data = new_chunks.read(length)
+                        new_file.write(data)
+                        file_hash.update(data)
+
+                    new_file.flush()
+                    stat = os.fstat(new_file.fileno())
+
+                # Reject the delta if the rebuilt file does not match the client's version
+                if file_hash.hexdigest() != expected_hash:
+                    os.remove(temp_path)
+                    self._send_response(409, {'error': f'Patched file \'{filename}\' does not match the expected hash'})
+                    return
+
+                os.replace(temp_path, _sync_name(filename, file_path), dst_dir_fd=SYNC_FD)
+                store_file_hash(file_path, expected_hash, stat)
+                _folder_changed()
+
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        log.info("Patched '%s'", filename)
+        self._send_response(200, {'message': f'File \'{filename}\' patched successfully'})
 
     def do_GET(self):
         """
@@ -94,36 +645,46 @@ class RequestHandler(BaseHTTPRequestHandler):
         - '/download/filename': Initiates file download.
         - '/files': Lists all files in the synchronized folder with their hashes.
         - '/file_info/filename': Fetches the modification time of the specified file.
+        - '/file_chunks/filename': Lists the content-defined chunks of the specified file.
         """
 
-        # Check if the request path starts with '/download/' to handle file download requests
-        if self.path.startswith('/download/'):
-            self.handle_download()  # Call the method to handle file download
+        # Find the handler of the request path in the GET routing table and call it
+        handler, args = self._route(self._GET_ROUTES)
+        if handler is None:
+            self._send_response(404, {'error': 'Not found'})
+            return
 
-        # Check if the request path is '/files' to list all files in the synchronized folder
-        elif self.path == '/files':
-            self.handle_files_list()  # Call the method to list the files and their hashes
+        handler(*args)
 
-        # Check if the request path starts with '/file_info/' to handle file information requests
-        elif self.path.startswith('/file_info/'):
-            self.handle_file_info()  # Call the method to fetch and return the file's modification time
-
-    def handle_download(self):
+    def handle_download(self, filename):
         """
         Handle file download requests.
 
         This method serves a file for download if it exists in the synchronized folder.
         If the file does not exist, it sends a 404 error.
-        """
 
-        # Extract the filename from the URL by splitting the path and getting the last part
-        filename = self.path.split('/')[-1]
+        Args:
+            filename (str): The name of the requested file.
+        """
 
         # Create the full file path by joining the synchronized folder path with the filename
-        file_path = os.path.join(SYNC_FOLDER, filename)
+        file_path = self._file_path(filename)
+        if file_path is None:
+            return
+
+        # Open the file in read-binary mode; a missing file is detected by the open call itself,
+        # without checking for it beforehand
+        try:
+            fd = os.open(_sync_name(filename, file_path), os.O_RDONLY | getattr(os, 'O_BINARY', 0), dir_fd=SYNC_FD)
+        except FileNotFoundError:
+            self._send_response(404, {'error': 'File not found'})
+            return
+
+        file = os.fdopen(fd, 'rb')
 
-        # Check if the file exists at the specified path
-        if os.path.exists(file_path):
+        with file:
+            # Get the file's size from the open file, so it can be sent as Content-Length
+            size = os.fstat(file.fileno()).st_size
 
             # Send a 200 OK response indicating the file is available for download
             self.send_response(200)
@@ -131,19 +692,55 @@ class RequestHandler(BaseHTTPRequestHandler):
             # Set the content type to 'application/octet-stream' to indicate binary file data
             self.send_header('Content-type', 'application/octet-stream')
 
+            # Set the Content-Length header so the client knows when the body ends
+            self.send_header('Content-Length', str(size))
+
             # Set the Content-Disposition header to specify that the file should be downloaded 
             # with the original filename
-            self.send_header('Content-Disposition', f'attachment; filename={filename}')
+            self.send_header('Content-Disposition', _content_disposition(filename))
 
             # End the headers section of the response
             self.end_headers()
 
-            # Open the file in read-binary mode and write the file content to the response body
-            with open(file_path, 'rb') as file:
-                self.wfile.write(file.read())
+            # Write the file content to the response body
+            self._send_file(file, size)
+
+    def _send_file(self, file, size):
+        """
+        Helper function to write the content of an open file to the response body.
+
+        Where available, 'sendfile' is used so the kernel copies the data straight from the
+        page cache to the socket, without passing it through Python; otherwise the file is copied
+        through 'wfile'.
+
+        Args:
+            file (file object): The file to send, opened in read-binary mode.
+            size (int): The number of bytes to send.
+        """
+
+        if hasattr(os, 'sendfile'):
+
+            # Flush the headers buffered in 'wfile' before writing to the socket directly
+            self.wfile.flush()
+
+            # 'socket.sendfile' calls 'os.sendfile' in a loop, and waits for the socket to
+            # become writable between calls, which the socket's timeout requires
+            sent = self.connection.sendfile(file, 0, size)
 
         else:
-            self._send_response(404, {'error': 'File not found'})
+            # Read the file into one preallocated buffer and send it from there,
+            # instead of allocating a new bytes object for every block
+            sent = 0
+            buf = bytearray(64 * 1024)
+            with memoryview(buf) as view:
+                while sent < size and (count := file.readinto(view[:size - sent])):
+                    self.wfile.write(view[:count])
+                    sent += count
+
+        # The file was truncated while it was being sent, so the response is shorter than its
+        # Content-Length and the connection cannot be reused
+        if sent < size:
+            self.close_connection = True
 
     def handle_files_list(self):
         """
@@ -151,76 +748,257 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         This method scans the synchronized folder, computes the hash of each file,
         and sends a JSON response with the file names and corresponding hashes.
+        Hashes are only recomputed for files whose modification time or size changed, and the
+        serialized response is reused for LISTING_TTL seconds while no request changes the folder.
+        Otherwise, HTTP/1.1 clients receive the list with chunked transfer encoding, an entry at a
+        time as the hashes complete, instead of only after the last file has been hashed.
         """
+        global _listing_cache
+
+        # Reuse the last response if the folder has not been changed through the server since,
+        # and it is recent enough to also cover changes made to the folder directly
+        with _listing_lock:
+            version = _folder_version
+            cached = _listing_cache
+        if cached is not None and cached[0] == version and time.monotonic() - cached[1] < LISTING_TTL:
+            self._send_body(200, cached[2])
+            return
+
+        # Collect the regular files in the synchronized folder, skipping directories and other
+        # entries that cannot be hashed
+        # 'scandir' returns the entry types along with the names, so no extra stat is needed per entry
+        # Uploads still being received are skipped: they are partial and not part of the folder yet
+        files = []
+        with os.scandir(SYNC_FOLDER) as entries:
+            for entry in entries:
+                if entry.name.startswith(TEMP_PREFIX) and entry.name.endswith(TEMP_SUFFIX):
+                    continue
+                try:
+                    if entry.is_file():
+                        files.append((entry.name, entry.path, entry.stat()))
+                except OSError:
+                    # The file was deleted since the folder was listed
+                    continue
+        file_paths = [path for _, path, _ in files]
+
+        # Hash the files in parallel, reusing the cached hash of unchanged files
+        # The hash implementations release the GIL while digesting, so the threads run on separate cores
+        pending = {_HASH_POOL.submit(cached_file_hash, path, stat): name for name, path, stat in files}
+
+        # Chunked transfer encoding requires HTTP/1.1; older clients get the whole list at once
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
 
-        # Initialize an empty list to store the information about each file
-        files_info = []
-
-        # Iterate over all files in the synchronized folder
-        for filename in os.listdir(SYNC_FOLDER):
-
-            # Construct the full path to the file
-            file_path = os.path.join(SYNC_FOLDER, filename)
-
-            # Compute the hash of the file
-            file_hash = compute_file_hash(file_path)
+        # Serialize the entries of the list as the hashes complete; the pieces also make up the
+        # complete body that is kept for later requests
+        pieces = []
+        complete = True  # Whether every file could be hashed
+
+        # Futures append to this list as they finish, so the loop below can tell whether more
+        # hashes are ready without waiting on every pending future again
+        finished = []
+        for future in pending:
+            future.add_done_callback(finished.append)
+
+        entries = []
+        for count, future in enumerate(as_completed(pending), 1):
+            file_hash = future.result()
+            # Files that could not be read are listed with a null hash, and the response is not reused
+            if file_hash is None:
+                complete = False
+            entries.append(_dumps({'filename': pending[future], 'hash': file_hash}))
+
+            # Every hash completed so far (all of them when the files are unchanged) goes into one chunk
+            if len(finished) > count:
+                continue
+            piece = (b',' if pieces else b'{"files":[') + b','.join(entries)
+            pieces.append(piece)
+            entries = []
+
+            if chunked:
+                self._write_chunk(piece)
+
+                # Send the entries now instead of when the write buffer fills up
+                if count < len(pending):
+                    self.wfile.flush()
+
+        pieces.append(b']}' if pieces else b'{"files":[]}')
+
+        prune_hash_cache(file_paths)
+
+        # Join the pieces into the complete body, so it can be reused
+        body = b''.join(pieces)
+
+        # Only keep the response if the folder did not change while it was being built
+        with _listing_lock:
+            if complete and version == _folder_version:
+                _listing_cache = (version, time.monotonic(), body)
+
+        if chunked:
+            # End the list, then send the zero-length chunk marking the end of the body
+            self._write_chunk(pieces[-1])
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self._send_body(200, body)
 
-            # Append the filename and its corresponding hash to the files_info list
-            files_info.append({'filename': filename, 'hash': file_hash})
+    def _write_chunk(self, data):
+        """
+        Helper function to write a piece of a response sent with chunked transfer encoding.
 
-        # Wrap the list in a dictionary before sending the response
-        self._send_response(200, {'files': files_info})
+        Args:
+            data (bytes): The data of the chunk; must not be empty, since an empty chunk ends the body.
+        """
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
 
-    def handle_file_info(self):
+    def handle_file_info(self, filename):
         """
         Fetch the modification time of a file.
 
         This method retrieves and returns the modification time of the specified file.
         If the file does not exist, it returns a 404 error.
-        """
 
-        # Extract the filename from the URL by splitting the path and getting the last part
-        filename = self.path.split('/')[-1]
+        Args:
+            filename (str): The name of the requested file.
+        """
 
         # Create the full file path by joining the synchronized folder path with the filename
-        file_path = os.path.join(SYNC_FOLDER, filename)
+        file_path = self._file_path(filename)
+        if file_path is None:
+            return
+
+        # Get the file's modification time; a missing file is reported by the stat call itself
+        try:
+            mod_time = os.stat(_sync_name(filename, file_path), dir_fd=SYNC_FD).st_mtime
+        except FileNotFoundError:
+            self._send_response(404, {'error': 'File not found'})
+            return
 
-        # Check if the file exists at the specified path
-        if os.path.exists(file_path):
+        self._send_response(200, {'filename': filename, 'mod_time': mod_time})
 
-            # Get the file's modification time
-            mod_time = os.path.getmtime(file_path)
+    def handle_file_info_batch(self):
+        """
+        Fetch the modification times of several files in one request.
 
-            self._send_response(200, {'filename': filename, 'mod_time': mod_time})
+        The request body is a JSON document of the form {"files": [filename, ...]}, and the response
+        maps every file that exists to its modification time: {"mod_times": {filename: mod_time, ...}}.
+        Files that do not exist (or whose name is invalid) are left out of the response.
+        """
 
-        else:
+        # Read the JSON request body, refusing bodies that are missing or too large
+        try:
+            content_length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.close_connection = True
+            self._send_response(411, {'error': 'Content-Length required'})
+            return
+
+        if content_length < 0:
+            self.close_connection = True
+            self._send_response(400, {'error': 'Invalid Content-Length'})
+            return
+
+        if content_length > MAX_JSON_BODY:
+            # The request body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_response(413, {'error': 'Request body too large'})
+            return
+
+        try:
+            filenames = _loads(self.rfile.read(content_length))['files']
+            if not isinstance(filenames, list):
+                raise TypeError('files must be a list')
+        except (ValueError, KeyError, TypeError):
+            self._send_response(400, {'error': 'Expected a JSON body of the form {"files": [...]}'})
+            return
+
+        mod_times = {}
+        for filename in filenames:
+            file_path = sync_path(filename) if isinstance(filename, str) else None
+            if file_path is None:
+                continue
+
+            # Get the file's modification time, leaving out files that do not exist
+            try:
+                mod_times[filename] = os.stat(_sync_name(filename, file_path), dir_fd=SYNC_FD).st_mtime
+            except FileNotFoundError:
+                pass
+
+        self._send_response(200, {'mod_times': mod_times})
+
+    def handle_file_chunks(self, filename):
+        """
+        List the content-defined chunks of a file.
+
+        This method returns the hash, offset and length of every chunk of the specified file,
+        which clients use to upload only the chunks that changed.
+        If the file does not exist, it returns a 404 error. If chunking is not compiled on the
+        server, it returns a 501 error, and clients fall back to uploading the whole file.
+
+        Args:
+            filename (str): The name of the requested file.
+        """
+
+        if not COMPILED_CHUNKING:
+            self._send_response(501, {'error': 'Delta transfers are not supported by this server'})
+            return
+
+        # Create the full file path by joining the synchronized folder path with the filename
+        file_path = self._file_path(filename)
+        if file_path is None:
+            return
+
+        # Split the file into chunks; a missing file is reported by opening it
+        try:
+            chunks = chunk_file(file_path)
+        except FileNotFoundError:
             self._send_response(404, {'error': 'File not found'})
+            return
+
+        self._send_response(200, {'filename': filename, 'chunks': chunks})
 
     def do_DELETE(self):
         """
         Handle DELETE requests to remove a file from the synchronized folder.
 
-        This method processes file deletion requests. If the file exists, it is deleted.
-        If the file is not found, a 404 error is returned.
+        This method processes '/delete/filename' requests, which are handled by 'handle_delete'.
         """
 
-        # Check if the request path starts with '/delete/' to handle file deletion requests
-        if self.path.startswith('/delete/'):
+        # Find the handler of the request path in the DELETE routing table and call it
+        handler, args = self._route(self._DELETE_ROUTES)
+        if handler is None:
+            self._send_response(404, {'error': 'Not found'})
+            return
 
-            # Extract the filename from the URL by splitting the path and getting the last part
-            filename = self.path.split('/')[-1]
+        handler(*args)
 
-            # Create the full file path by joining the synchronized folder path with the filename
-            file_path = os.path.join(SYNC_FOLDER, filename)
+    def handle_delete(self, filename):
+        """
+        Handle file deletion requests.
 
-            # Check if the file exists at the specified path
-            if os.path.exists(file_path):
+        This method deletes the specified file if it exists in the synchronized folder.
+        If the file is not found, a 404 error is returned.
 
-                # If the file exists, remove it
-                os.remove(file_path)
+        Args:
+            filename (str): The name of the file to delete.
+        """
+
+        # Create the full file path by joining the synchronized folder path with the filename
+        file_path = self._file_path(filename)
+        if file_path is None:
+            return
+
+        # Remove the file; a missing file is reported by the remove call itself
+        try:
+            os.unlink(_sync_name(filename, file_path), dir_fd=SYNC_FD)
+        except FileNotFoundError:
+            self._send_response(404, {'error': 'File not found'})
+            return
 
-                logging.info(f"Deleted \'{filename}\'")
-                self._send_response(200, {'message': f'File \'{filename}\' deleted successfully'})
+        _folder_changed()
 
-            else:
-                self._send_response(404, {'error': 'File not found'})
+        log.info("Deleted '%s'", filename)
+        self._send_response(200, {'message': f'File \'{filename}\' deleted successfully'})
@@ -4,7 +4,11 @@ The server listens for incoming HTTP requests on a specified port and handles th
 request handler class ('RequestHandler').
 """
 
+import socket
 import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http.server import ThreadingHTTPServer
 from handlers import RequestHandler
 
@@ -12,12 +16,95 @@ from handlers import RequestHandler
 logging.basicConfig(level=logging.INFO)
 
 
-def run(server_class=ThreadingHTTPServer, handler_class=RequestHandler, port=8080):
+class PooledHTTPServer(ThreadingHTTPServer):
+    """
+    This class extends ThreadingHTTPServer to handle connections on a fixed pool of worker
+    threads instead of starting a new thread for every connection. Thread creation is taken off
+    the accept path and the number of threads stays bounded under load; connections arriving
+    while every worker is busy wait in the pool's queue.
+    """
+
+    # Maximum number of connections handled at the same time
+    max_workers = 32
+
+    # Number of pending connections the listening socket queues before refusing new ones
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class):
+        # Created first: if binding the address fails, the base class calls 'server_close'
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='http')
+
+        # Connections being handled by a worker, shut down when the server is closed
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        """
+        Hand an accepted connection over to a worker thread of the pool.
+
+        Args:
+            request (socket.socket): The accepted connection.
+            client_address (tuple): The address of the client.
+        """
+        future = self._pool.submit(self.process_request_thread, request, client_address)
+        future.add_done_callback(functools.partial(self._close_cancelled, request))
+
+    def process_request_thread(self, request, client_address):
+        """
+        Handle a connection on a worker thread, keeping track of it while it is open.
+
+        Args:
+            request (socket.socket): The accepted connection.
+            client_address (tuple): The address of the client.
+        """
+        with self._connections_lock:
+            self._connections.add(request)
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._connections_lock:
+                self._connections.discard(request)
+
+    def _close_cancelled(self, request, future):
+        """
+        Close a connection that was still waiting for a worker when the server was closed.
+
+        Args:
+            request (socket.socket): The accepted connection.
+            future (concurrent.futures.Future): The pool task that would have handled it.
+        """
+        if future.cancelled():
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """
+        Close the listening socket and stop the worker threads, closing the connections
+        still waiting for a worker.
+
+        Unlike the daemon threads of ThreadingHTTPServer, the pool's workers are joined when the
+        interpreter exits, so the open connections are shut down as well: workers waiting for a
+        request or sending a download then finish at once instead of after their timeout.
+        """
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed by the client
+                pass
+
+
+def run(server_class=PooledHTTPServer, handler_class=RequestHandler, port=8080):
     """
     Initialize and run the HTTP server with multithreading.
     
     Args:
-        server_class (type): The class used for the HTTP server (default: ThreadingHTTPServer).
+        server_class (type): The class used for the HTTP server (default: PooledHTTPServer).
         handler_class (type): The request handler class to process HTTP requests (default: RequestHandler).
         port (int): The port on which the server will listen for incoming requests (default: 8080).
     """